@@ -0,0 +1,120 @@
+"""Envío de alertas contra un servidor SMTP local de prueba.
+
+Levanta un servidor SMTP mínimo en 127.0.0.1 (sin TLS ni autenticación),
+encola una ráfaga de alertas en el despachador y mide cuánto bloquea
+`submit`, cuántos correos y conexiones se usaron y cuánto tardó en vaciarse
+la cola. Con `--fail-first N` el servidor rechaza con 451 los primeros N
+envíos para ejercitar los reintentos.
+
+Uso: python -m benchmarks.alerts [--alerts 500] [--recipients 2] [--window 1]
+"""
+import argparse
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from utils.alert_system import AlertDispatcher, AlertSystem
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Servidor SMTP de prueba que solo cuenta conexiones y mensajes"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fail_first: int = 0):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.fail_remaining = fail_first
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                with server.lock:
+                    failing = server.fail_remaining > 0
+                    server.fail_remaining -= failing
+                    server.messages += not failing
+                self.reply('451 Try again later' if failing else '250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+def run(alerts: int, recipients: int, window: float, fail_first: int) -> dict:
+    server = SMTPStandIn(fail_first)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    config = {
+        'smtp_server': '127.0.0.1',
+        'smtp_port': server.server_address[1],
+        'use_tls': False,
+        'sender_email': 'alertas@localhost',
+        'recipients': [f'admin{i}@localhost' for i in range(recipients)],
+    }
+    workdir = tempfile.mkdtemp(prefix='alerts_bench_')
+    config_path = os.path.join(workdir, 'email_config.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+
+    cwd = os.getcwd()
+    os.chdir(workdir)  # fraud_alerts.log queda en el directorio temporal
+    try:
+        dispatcher = AlertDispatcher(AlertSystem(config_path), digest_seconds=window, retry_backoff=0.05)
+        started = time.perf_counter()
+        for i in range(alerts):
+            dispatcher.submit({'id': i, 'user_id': 1, 'amount': 100.0 + i, 'date': '2025-01-01 10:00:00'},
+                              {'confidence': 0.9, 'reasons': ['prueba']})
+        submit_seconds = time.perf_counter() - started
+        dispatcher.stop(timeout=60)
+        total_seconds = time.perf_counter() - started
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+
+    return {
+        'alerts': alerts,
+        'submit_per_alert_us': round(submit_seconds / alerts * 1e6, 2),
+        'drain_seconds': round(total_seconds, 4),
+        'smtp_connections': server.connections,
+        'smtp_messages': server.messages,
+        'dispatcher': dispatcher.metrics(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=500)
+    parser.add_argument('--recipients', type=int, default=2)
+    parser.add_argument('--window', type=float, default=1.0, help='segundos de agrupación')
+    parser.add_argument('--fail-first', type=int, default=0, help='envíos rechazados con 451 al inicio')
+    args = parser.parse_args(argv)
+
+    print(json.dumps(run(args.alerts, args.recipients, args.window, args.fail_first), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+"""Benchmark de escritura concurrente sobre SQLite.
+
+Lanza N hilos escritores (como los hilos de Flask más el monitor), cada uno
+con su propia sesión y un commit por transacción, y compara el engine sin
+ajustes contra `create_db_engine` con WAL, synchronous=NORMAL y busy_timeout.
+
+Uso: python -m benchmarks.db_concurrency --writers 8 --inserts 200
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from core.database import Base, create_db_engine
+from core.models import Transaction, User
+
+
+def run(writers: int, inserts: int, pragmas=None) -> dict:
+    """Mide transacciones/segundo y errores de bloqueo con `writers` hilos"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", pragmas=pragmas,
+                                     pool_size=writers + 2)
+        Base.metadata.create_all(db_engine)
+        Session = sessionmaker(bind=db_engine)
+
+        session = Session()
+        session.add(User(username='bench', email='bench@example.com', password_hash='x', role='user'))
+        session.commit()
+        user_id = session.query(User.id).scalar()
+        session.close()
+
+        errors = []
+        barrier = threading.Barrier(writers + 1)
+
+        def writer(worker: int):
+            barrier.wait()
+            for i in range(inserts):
+                session = Session()
+                try:
+                    session.add(Transaction(user_id=user_id, amount=worker * 1000 + i, date=datetime.now(),
+                                            payment_method='Efectivo', is_flagged=False))
+                    session.commit()
+                except OperationalError as e:
+                    session.rollback()
+                    errors.append(str(e.orig))
+                finally:
+                    session.close()
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        committed = writers * inserts - len(errors)
+        db_engine.dispose()
+        return {
+            'writers': writers,
+            'attempted': writers * inserts,
+            'committed': committed,
+            'lock_errors': len(errors),
+            'seconds': round(elapsed, 3),
+            'tx_per_second': round(committed / elapsed, 1) if elapsed else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--inserts', type=int, default=200, help='inserciones por hilo')
+    args = parser.parse_args()
+
+    results = {
+        'default': run(args.writers, args.inserts, pragmas={}),
+        'tuned': run(args.writers, args.inserts),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
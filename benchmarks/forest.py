@@ -0,0 +1,118 @@
+"""Paridad y latencia del bosque compilado frente a sklearn.
+
+Entrena un IsolationForest con la configuración de FraudDetector sobre datos
+sintéticos, verifica que `CompiledForest` dé exactamente los mismos puntajes y
+predicciones que sklearn y mide la latencia de una fila y de lotes (hasta
+COMPILED_MAX_BATCH filas se usa el bosque compilado, por encima sklearn). El
+tamaño de lote desde el que sklearn gana (`crossover_rows`) es la referencia
+para fijar COMPILED_MAX_BATCH.
+
+Uso: python -m benchmarks.forest [--rows 50000] [--repeat 200]
+"""
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from core.fraud_detection import COMPILED_MAX_BATCH, FEATURES, CompiledForest, FraudDetector, ScoringModel
+
+
+CROSSOVER_SIZES = (64, 96, 128, 160, 192, 224, 256, 320, 384, 512)
+
+
+def synthetic(rows: int, seed: int = 0) -> np.ndarray:
+    """Montos log-normales, horas, días y features de comportamiento con algo de estructura"""
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((rows, len(FEATURES)))
+    X[:, 0] = rng.lognormal(8, 1.5, rows)
+    X[:, 1] = rng.integers(0, 24, rows)
+    X[:, 2] = rng.integers(0, 7, rows)
+    X[:, 3] = np.log1p(X[:, 0])
+    return X
+
+
+def median_seconds(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times))
+
+
+def run(rows: int, repeat: int) -> dict:
+    X_train = synthetic(rows)
+    scaler = StandardScaler().fit(X_train)
+    model = FraudDetector()._build_model().fit(scaler.transform(X_train))
+    scoring_model = ScoringModel(model, scaler, 'bench', FEATURES)
+    compiled = CompiledForest.from_model(model, scaler)
+
+    def sklearn_scores(X):
+        return model.decision_function(scaler.transform(X))
+
+    # Paridad: filas de entrenamiento, filas nuevas y valores extremos
+    X_new = synthetic(20000, seed=1)
+    X_extreme = synthetic(2000, seed=2) * 50
+    parity = {}
+    for name, X in (('train', X_train[:20000]), ('new', X_new), ('extreme', X_extreme)):
+        expected = sklearn_scores(X)
+        got = compiled.decision_function(X)
+        parity[name] = {
+            'rows': len(X),
+            'identical_scores': bool(np.array_equal(expected, got)),
+            'max_abs_diff': float(np.max(np.abs(expected - got))),
+            'identical_predictions': bool(np.array_equal(model.predict(scaler.transform(X)), compiled.predict(X)))
+        }
+
+    single = X_new[:1]
+    latency = {
+        'single_sklearn_ms': median_seconds(lambda: sklearn_scores(single), repeat) * 1e3,
+        'single_compiled_ms': median_seconds(lambda: compiled.decision_function(single), repeat) * 1e3,
+    }
+    for size in (100, COMPILED_MAX_BATCH, 10000):
+        batch = X_new[:size]
+        latency[f'batch_{size}_sklearn_ms'] = median_seconds(lambda: sklearn_scores(batch), 5) * 1e3
+        latency[f'batch_{size}_compiled_ms'] = median_seconds(lambda: compiled.decision_function(batch), 5) * 1e3
+    latency = {name: round(value, 4) for name, value in latency.items()}
+
+    crossover = None
+    for size in CROSSOVER_SIZES:
+        batch = X_new[:size]
+        if median_seconds(lambda: compiled.decision_function(batch), 15) \
+                >= median_seconds(lambda: sklearn_scores(batch), 15):
+            crossover = size
+            break
+
+    arrays = (compiled.feature, compiled.threshold, compiled.children, compiled.leaf_value)
+    return {
+        'train_rows': rows,
+        'trees': len(model.estimators_),
+        'nodes': int(len(compiled.threshold)),
+        'max_depth': compiled.max_depth,
+        'compiled_mb': round(sum(a.nbytes for a in arrays) / 2 ** 20, 2),
+        'runtime_probe_passed': scoring_model.compiled is not None,
+        'parity': parity,
+        'latency': latency,
+        'single_row_speedup': round(latency['single_sklearn_ms'] / latency['single_compiled_ms'], 1),
+        'compiled_max_batch': COMPILED_MAX_BATCH,
+        'crossover_rows': crossover,  # primer lote en que sklearn es igual o más rápido
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000, help='filas de entrenamiento')
+    parser.add_argument('--repeat', type=int, default=200, help='repeticiones para la latencia de una fila')
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.repeat)
+    print(json.dumps(results, indent=2))
+    ok = results['runtime_probe_passed'] and all(
+        check['identical_scores'] and check['identical_predictions'] for check in results['parity'].values())
+    print("✅ Paridad exacta con sklearn" if ok else "❌ El bosque compilado no coincide con sklearn")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Tiempo de importación y memoria base de un worker web.
+
+Importa core.app en procesos nuevos con `python -X importtime`, toma la
+mediana del tiempo acumulado y la memoria (ru_maxrss) después de importar y
+de atender la página de login, y verifica que ninguna librería pesada
+(NumPy, pandas, sklearn, SciPy, joblib, fpdf) se cargue en ese camino: falla
+si alguna vuelve a importarse de forma anticipada o si se supera `--budget-ms`.
+
+Uso: python -m benchmarks.importtime [--runs 5] [--budget-ms 0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_PACKAGES = ('numpy', 'pandas', 'sklearn', 'scipy', 'joblib', 'fpdf')
+
+# Se ejecuta en un proceso nuevo: memoria (KB) y librerías pesadas tras importar y tras el login
+PROBE = """
+import json, resource, sys
+HEAVY = set(sys.argv[1].split(','))
+
+def state():
+    heavy = sorted({name.split('.')[0] for name in sys.modules} & HEAVY)
+    return {'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'heavy': heavy}
+
+import core.app
+imported = state()
+core.app.create_app(background_services=False).test_client().get('/')
+print(json.dumps({'imported': imported, 'served': state()}))
+"""
+
+
+def import_time_us(stderr: str, module: str = 'core.app') -> int:
+    """Tiempo acumulado de `module` en la salida de -X importtime"""
+    for line in stderr.splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise ValueError(f"{module} no aparece en la salida de -X importtime")
+
+
+def run(runs: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix='importtime_bench_')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               MODEL_DIR=os.path.join(workdir, 'ml'),
+               RUN_DIR=os.path.join(workdir, 'run'),
+               PYTHONDONTWRITEBYTECODE='1')
+    env.pop('SCORING_SOCKET', None)
+
+    import_ms, imported_kb, served_kb = [], [], []
+    heavy_loaded = set()
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import core.app'],
+                                env=env, capture_output=True, text=True, check=True)
+        import_ms.append(import_time_us(result.stderr) / 1000)
+
+        output = subprocess.run([sys.executable, '-c', PROBE, ','.join(HEAVY_PACKAGES)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        imported_kb.append(probe['imported']['rss_kb'])
+        served_kb.append(probe['served']['rss_kb'])
+        heavy_loaded.update(probe['imported']['heavy'], probe['served']['heavy'])
+
+    return {
+        'runs': runs,
+        'import_core_app_ms': round(statistics.median(import_ms), 1),
+        'rss_after_import_mb': round(statistics.median(imported_kb) / 1024, 1),
+        'rss_after_login_page_mb': round(statistics.median(served_kb) / 1024, 1),
+        'heavy_modules_loaded': sorted(heavy_loaded),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=0, help='falla si la mediana la supera (0 = sin límite)')
+    args = parser.parse_args(argv)
+
+    results = run(args.runs)
+    print(json.dumps(results, indent=2))
+    ok = not results['heavy_modules_loaded']
+    if not ok:
+        print(f"❌ Librerías pesadas cargadas sin usarse: {', '.join(results['heavy_modules_loaded'])}")
+    if args.budget_ms and results['import_core_app_ms'] > args.budget_ms:
+        print(f"❌ Importar core.app tardó {results['import_core_app_ms']} ms (límite {args.budget_ms} ms)")
+        ok = False
+    if ok:
+        print("✅ core.app se importa sin las librerías pesadas")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Auditoría de planes de consulta de las rutas críticas.
+
+Crea el esquema en una base SQLite en memoria y verifica con
+EXPLAIN QUERY PLAN que cada consulta frecuente haga una búsqueda acotada
+(SEARCH) sobre un índice: un SCAN cuenta como recorrido completo aunque sea
+sobre un índice.
+
+Uso: python -m benchmarks.query_plans
+"""
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from core.database import Base, explain_query_plan
+from core.pagination import transactions_page_query
+from core.queries import (duplicate_transaction_query, nearby_transactions_query, new_transactions_query,
+                          recent_transactions_query, report_summary_query, report_transactions_query,
+                          report_watermark_query, stale_scores_query, transaction_columns_query,
+                          transactions_by_ids_query)
+
+
+def hot_queries(db_session) -> dict:
+    """Consultas a auditar, construidas con las mismas funciones que usa la aplicación"""
+    now = datetime.now()
+    return {
+        'app.transactions (página)': transactions_page_query(db_session, 1, 50),
+        'app.transactions (página siguiente)': transactions_page_query(db_session, 1, 50, cursor=(now, 100)),
+        'app.transactions (filtros)': transactions_page_query(
+            db_session, 1, 50, start_date=now - timedelta(days=30), end_date=now, method='Efectivo',
+            flagged_only=True),
+        'app.add_transaction (duplicados)': duplicate_transaction_query(
+            db_session, 1, 100.0, 'Efectivo', now - timedelta(minutes=1), 0.05),
+        'app.get_recent_transactions': recent_transactions_query(db_session, 1),
+        'ingest.BulkIngestor (duplicados)': nearby_transactions_query(db_session, 1, [
+            (now - timedelta(days=400, minutes=1), now - timedelta(days=400) + timedelta(minutes=1)),
+            (now - timedelta(minutes=1), now + timedelta(minutes=1))]),
+        'report_generator (detalle)': report_transactions_query(
+            db_session, 1, '2025-01-01', '2025-12-31'),
+        'report_generator (resumen por método)': report_summary_query(
+            db_session, 1, '2025-01-01', '2025-12-31', group_by='method'),
+        'report_generator (resumen)': report_summary_query(db_session, 1, '2025-01-01', '2025-12-31'),
+        'report_generator (histograma diario)': report_summary_query(
+            db_session, 1, '2025-01-01', '2025-12-31', group_by='day'),
+        'report_jobs (huella de datos)': report_watermark_query(db_session, 1, '2025-01-01', '2025-12-31'),
+        'monitoring._catch_up': new_transactions_query(db_session, 100),
+        'monitoring.process_batch': transactions_by_ids_query(db_session, [101, 102, 103]),
+        'monitoring.ScoreBackfillJob': stale_scores_query(db_session, 0, 'v1', 1000),
+        'loader.iter_transaction_chunks': transaction_columns_query(
+            db_session, ('id', 'amount', 'date', 'is_flagged'), after_id=10000),
+    }
+
+
+SCANNED_TABLES = ('transactions', 'daily_user_stats')
+# Consultas a las que se les permite recorrer entero un índice que las cubre
+# (SCAN ... USING COVERING INDEX); cualquier otro SCAN cuenta como recorrido completo
+COVERING_SCANS_ALLOWED = set()
+
+
+def uses_full_scan(plan: list, allow_covering_scan: bool = False) -> bool:
+    """True si algún paso sobre `transactions` o `daily_user_stats` no es una búsqueda acotada (SEARCH)"""
+    for step in plan:
+        words = step.split()
+        if len(words) < 2 or words[1] not in SCANNED_TABLES or words[0] == 'SEARCH':
+            continue
+        if allow_covering_scan and words[0] == 'SCAN' and 'USING COVERING INDEX' in step:
+            continue
+        return True
+    return False
+
+
+def audit(bind=None) -> dict:
+    """Devuelve {consulta: plan} y lanza AssertionError si alguna hace un recorrido completo"""
+    if bind is None:
+        bind = create_engine('sqlite://')
+        Base.metadata.create_all(bind)
+
+    db_session = sessionmaker(bind=bind)()
+    try:
+        plans = {name: explain_query_plan(query.statement, bind) for name, query in hot_queries(db_session).items()}
+    finally:
+        db_session.close()
+
+    scans = [name for name, plan in plans.items() if uses_full_scan(plan, name in COVERING_SCANS_ALLOWED)]
+    assert not scans, f"Consultas sin índice: {', '.join(scans)}"
+    return plans
+
+
+if __name__ == '__main__':
+    try:
+        for name, plan in audit().items():
+            print(f"✅ {name}: {' | '.join(plan)}")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
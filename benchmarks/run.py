@@ -0,0 +1,317 @@
+"""Suite de benchmarks de las rutas críticas.
+
+Para cada tamaño crea una base SQLite sintética (muchos usuarios, montos
+con escala propia por usuario, fechas de los últimos 90 días) y mide en un
+proceso aparte, con su propio DATABASE_URL y MODEL_DIR:
+
+  - carga de datos y recálculo de features de comportamiento
+  - entrenamiento (tiempo y pico de memoria)
+  - latencia de puntuación individual contra puntuación por lotes
+  - inserciones por segundo a través del cliente de prueba de Flask
+  - generación de reportes PDF y CSV (tiempo y pico de memoria)
+
+El resultado es un JSON que se puede comparar entre commits:
+
+  python -m benchmarks.run --sizes 10000 100000 --output bench.json
+  python -m benchmarks.run --sizes 10000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+SEED_CHUNK = 50000
+SCORE_SINGLE_CALLS = 200
+SCORE_BATCH_SIZE = 10000
+API_INSERTS = 200
+BULK_ROWS = 5000
+
+# tracemalloc agrega overhead a código con muchas asignaciones; --no-memory da tiempos limpios
+TRACE_MEMORY = True
+
+# Métricas donde un valor más alto es mejor; en el resto (segundos, MB) gana el más bajo
+HIGHER_IS_BETTER = ('per_second',)
+
+
+def measure(fn, *args, **kwargs) -> tuple:
+    """Ejecuta `fn` y devuelve (resultado, segundos, pico de memoria en MB o None)"""
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if TRACE_MEMORY else None
+        if TRACE_MEMORY:
+            tracemalloc.stop()
+    return result, round(elapsed, 4), round(peak / 2 ** 20, 2) if peak is not None else None
+
+
+def seed(size: int, users: int, seed_value: int = 42) -> None:
+    """Carga `size` transacciones sintéticas repartidas entre `users` usuarios"""
+    import numpy as np
+    from sqlalchemy import insert
+    from core.database import Session
+    from core.models import Transaction, User, VALID_METHODS
+
+    rng = np.random.default_rng(seed_value)
+    session = Session()
+    try:
+        session.execute(insert(User), [{
+            'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password_hash': 'x', 'role': 'user'
+        } for i in range(users)])
+        user_ids = np.array([row[0] for row in session.query(User.id).order_by(User.id)])
+        user_scale = rng.uniform(8, 13, size=len(user_ids))  # log del monto típico de cada usuario
+
+        start = datetime.now() - timedelta(days=90)
+        span = 90 * 86400 / size  # segundos por transacción: los ids crecen con la fecha
+        for offset in range(0, size, SEED_CHUNK):
+            n = min(SEED_CHUNK, size - offset)
+            owners = rng.integers(0, len(user_ids), size=n)
+            amounts = np.round(rng.lognormal(user_scale[owners], 0.6), 2)
+            seconds = np.sort(rng.uniform(offset * span, (offset + n) * span, size=n))
+            methods = rng.choice(VALID_METHODS, size=n, p=[0.4, 0.3, 0.2, 0.1])
+            session.execute(insert(Transaction), [{
+                'user_id': int(user_ids[owner]),
+                'amount': float(amount),
+                'date': start + timedelta(seconds=float(second)),
+                'payment_method': str(method),
+                'is_flagged': False
+            } for owner, amount, second, method in zip(owners, amounts, seconds, methods)])
+            session.commit()
+    finally:
+        session.close()
+
+
+def bench_scoring(detector) -> dict:
+    import numpy as np
+    from core.fraud_detection import score_cache
+    now = datetime.now()
+    rng = np.random.default_rng(7)
+    rows = [{'amount': float(amount), 'date': now} for amount in rng.lognormal(10, 1, SCORE_BATCH_SIZE)]
+
+    # Primera pasada sin caché; la segunda repite las mismas filas y acierta en la caché
+    score_cache.clear()
+    latencies, cached_latencies = [], []
+    for pass_latencies in (latencies, cached_latencies):
+        for row in rows[:SCORE_SINGLE_CALLS]:
+            started = time.perf_counter()
+            detector.detect_fraud(row)
+            pass_latencies.append(time.perf_counter() - started)
+
+    _, batch_seconds, batch_peak = measure(detector.detect_fraud_batch, rows)
+    latencies = np.array(latencies) * 1e6
+    cached_latencies = np.array(cached_latencies) * 1e6
+    return {
+        'single_p50_us': round(float(np.percentile(latencies, 50)), 1),
+        'single_p95_us': round(float(np.percentile(latencies, 95)), 1),
+        'single_cached_p50_us': round(float(np.percentile(cached_latencies, 50)), 1),
+        'score_cache': score_cache.metrics(),
+        'batch_rows': len(rows),
+        'batch_seconds': batch_seconds,
+        'batch_per_row_us': round(batch_seconds / len(rows) * 1e6, 2),
+        'batch_peak_mb': batch_peak,
+    }
+
+
+def bench_inserts(flask_app) -> dict:
+    client = flask_app.test_client()
+    client.post('/register', data={'username': 'api', 'email': 'api@example.com', 'password': 'pw'})
+    client.post('/', data={'email': 'api@example.com', 'password': 'pw'})
+
+    started = time.perf_counter()
+    for i in range(API_INSERTS):
+        response = client.post('/api/transactions', json={'amount': str(1000 + i * 7), 'method': 'Efectivo'})
+        assert response.status_code == 200, response.get_json()
+    api_seconds = time.perf_counter() - started
+
+    start = datetime.now() - timedelta(days=1)
+    body = 'amount,method,date\n' + '\n'.join(
+        f"{100 + i},Transferencia,{(start + timedelta(seconds=i)).isoformat(sep=' ')}" for i in range(BULK_ROWS))
+    response, bulk_seconds, bulk_peak = measure(client.post, '/api/transactions/bulk?format=csv', data=body)
+    assert response.status_code == 200, response.get_json()
+    return {
+        'api_inserts': API_INSERTS,
+        'api_per_second': round(API_INSERTS / api_seconds, 1),
+        'bulk_rows': BULK_ROWS,
+        'bulk_seconds': bulk_seconds,
+        'bulk_rows_per_second': round(BULK_ROWS / bulk_seconds, 1),
+        'bulk_peak_mb': bulk_peak,
+    }
+
+
+def bench_reports(reports_dir: str) -> dict:
+    from sqlalchemy import func
+    from core.database import Session
+    from core.models import Transaction
+    from core.report_generator import ReportGenerator
+
+    session = Session()
+    try:
+        # El usuario con más transacciones es el peor caso
+        user_id, rows = session.query(Transaction.user_id, func.count()) \
+            .group_by(Transaction.user_id).order_by(func.count().desc()).first()
+    finally:
+        session.close()
+
+    generator = ReportGenerator()
+    generator.reports_dir = reports_dir
+    start_date = (datetime.now() - timedelta(days=120)).strftime('%Y-%m-%d')
+    end_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    results = {'user_rows': rows}
+    for report_format in ('pdf', 'csv'):
+        generate = getattr(generator, f'generate_{report_format}_report')
+        path, seconds, peak = measure(generate, user_id, start_date, end_date)
+        results[f'{report_format}_seconds'] = seconds
+        results[f'{report_format}_peak_mb'] = peak
+        results[f'{report_format}_bytes'] = os.path.getsize(path)
+
+    # Descarga por streaming, como la sirve /api/reports/generate
+    _, results['csv_stream_seconds'], results['csv_stream_peak_mb'] = measure(
+        lambda: sum(len(chunk) for chunk in generator.iter_csv_report(user_id, start_date, end_date)))
+    return results
+
+
+def run_size(size: int, users: int) -> dict:
+    """Corre todos los benchmarks sobre la base ya configurada por variables de entorno"""
+    # create_app crea el esquema; sin servicios de fondo, el relleno de puntajes
+    # no compite con las mediciones
+    from core import app as app_module
+    from core import rollups
+    from core.features import user_features
+    from core.fraud_detection import FraudDetector
+    app_module.create_app(background_services=False)
+
+    results = {'size': size, 'users': users}
+    _, results['seed_seconds'], _ = measure(seed, size, users)
+    _, results['features_rebuild_seconds'], results['features_rebuild_peak_mb'] = measure(user_features.rebuild)
+    _, results['rollups_rebuild_seconds'], _ = measure(rollups.rebuild)
+
+    detector = FraudDetector()
+    trained, results['train_seconds'], results['train_peak_mb'] = measure(detector.train_model, True)
+    assert trained, "No se pudo entrenar el modelo"
+
+    results['scoring'] = bench_scoring(detector)
+
+    results['inserts'] = bench_inserts(app_module.app)
+    reports_dir = os.path.join(os.environ['MODEL_DIR'], 'reports')
+    os.makedirs(reports_dir, exist_ok=True)
+    results['reports'] = bench_reports(reports_dir)
+    return results
+
+
+def run_in_subprocess(size: int, users: int) -> dict:
+    """Cada tamaño en un proceso nuevo: el engine y el modelo se configuran al importar"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}", MODEL_DIR=tmp)
+        command = [sys.executable, '-m', 'benchmarks.run', '--worker', str(size), '--users', str(users)]
+        if not TRACE_MEMORY:
+            command.append('--no-memory')
+        output = subprocess.run(
+            command,
+            env=env, check=True, stdout=subprocess.PIPE, text=True,
+            cwd=os.path.join(os.path.dirname(__file__), '..')
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def flatten(results: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Imprime la diferencia por métrica y devuelve las que empeoraron más de `threshold`"""
+    if baseline['meta'].get('memory_traced') != current['meta'].get('memory_traced'):
+        print("⚠️  Una corrida midió memoria y la otra no: los tiempos no son comparables", file=sys.stderr)
+
+    regressions = []
+    for size, results in current['results'].items():
+        old = flatten(baseline['results'].get(size, {}))
+        for metric, value in flatten(results).items():
+            if metric not in old or not old[metric] or metric.endswith(('size', 'users', 'rows', 'inserts', 'bytes')):
+                continue
+            change = (value - old[metric]) / old[metric]
+            worse = -change if any(key in metric for key in HIGHER_IS_BETTER) else change
+            mark = '❌' if worse > threshold else '  '
+            print(f"{mark} [{size}] {metric}: {old[metric]} -> {value} ({change:+.1%})")
+            if worse > threshold:
+                regressions.append(f'{size}:{metric}')
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000], help='transacciones por base')
+    parser.add_argument('--users', type=int, default=None, help='usuarios (por defecto 1 cada 100 transacciones)')
+    parser.add_argument('--output', help='archivo JSON de resultados')
+    parser.add_argument('--compare', help='JSON de una corrida anterior contra el cual comparar')
+    parser.add_argument('--threshold', type=float, default=0.2, help='empeoramiento tolerado (0.2 = 20%%)')
+    parser.add_argument('--no-memory', action='store_true', help='no medir el pico de memoria (tiempos sin overhead)')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.no_memory
+
+    if args.worker is not None:
+        # Proceso hijo: los mensajes de la aplicación van a stderr y el JSON queda en la última línea
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        results = run_size(args.worker, args.users)
+        sys.stdout = stdout
+        print(json.dumps(results))
+        return 0
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'memory_traced': TRACE_MEMORY,
+        },
+        'results': {}
+    }
+    for size in args.sizes:
+        users = args.users or max(10, size // 100)
+        print(f"⏱️  {size} transacciones, {users} usuarios...", file=sys.stderr)
+        report['results'][str(size)] = run_in_subprocess(size, users)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"Regresiones: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
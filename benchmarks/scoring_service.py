@@ -0,0 +1,157 @@
+"""Servicio de puntuación frente a puntuación en proceso.
+
+Publica un modelo sintético en un MODEL_DIR temporal, levanta el servicio
+(core.scoring_service) con su propio socket y compara:
+- paridad exacta de puntajes con FraudDetector en proceso,
+- latencia de una fila y de un lote,
+- rendimiento con varios hilos (en proceso comparten el GIL),
+- memoria de cada proceso puntuador (PSS anónima y de archivos mapeados).
+
+Uso: python -m benchmarks.scoring_service [--workers 2] [--threads 4]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+WORKDIR = tempfile.mkdtemp(prefix='scoring_bench_')
+os.environ['MODEL_DIR'] = WORKDIR  # antes de importar core: el registro toma MODEL_DIR al importarse
+os.environ.pop('SCORING_SOCKET', None)
+
+import numpy as np  # noqa: E402
+from sklearn.preprocessing import StandardScaler  # noqa: E402
+from benchmarks.forest import synthetic  # noqa: E402
+from core.fraud_detection import FEATURES, FraudDetector, model_registry  # noqa: E402
+from core.models import BEHAVIOR_FEATURES  # noqa: E402
+from core.scoring_service import ScoringClient, start_sidecar  # noqa: E402
+
+
+def transactions(rows: int, seed: int = 3) -> list:
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1)
+    return [{
+        'amount': float(rng.lognormal(8, 1.5)),
+        'date': start + timedelta(seconds=int(rng.integers(0, 90 * 86400))),
+        **{name: float(value) for name, value in zip(BEHAVIOR_FEATURES, rng.standard_normal(len(BEHAVIOR_FEATURES)))}
+    } for _ in range(rows)]
+
+
+def median_ms(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return round(float(np.median(times)) * 1e3, 4)
+
+
+def throughput(score, threads: int, calls: int, rows: list) -> float:
+    """Llamadas de una fila por segundo con `threads` hilos en paralelo"""
+    def worker():
+        for i in range(calls):
+            score([rows[i % len(rows)]])
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return round(threads * calls / (time.perf_counter() - started), 1)
+
+
+def memory_kb(pid: int) -> dict:
+    """Rss y Pss (memoria compartida repartida entre procesos) de /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss_Anon', 'Pss_File'):
+                values[name.lower()] = int(rest.split()[0])
+    return values
+
+
+def children(pid: int) -> list:
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def run(workers: int, threads: int, train_rows: int) -> dict:
+    X = synthetic(train_rows)
+    scaler = StandardScaler().fit(X)
+    model = FraudDetector()._build_model().fit(scaler.transform(X))
+    model_registry.publish(model, scaler, FEATURES, {'n_samples': train_rows})
+
+    socket_path = os.path.join(WORKDIR, 'scoring.sock')
+    os.environ['SCORING_WORKERS'] = str(workers)
+    process = start_sidecar(socket_path)
+    try:
+        client = ScoringClient(socket_path)
+        local = FraudDetector(service=False)  # False: nunca usar el servicio
+        local.cache = None  # comparar puntuación contra puntuación, sin aciertos de caché
+        service = FraudDetector(service=client)
+        rows = transactions(5000)
+
+        # Esperar a que los hijos abran el modelo exportado
+        deadline = time.monotonic() + 30
+        while client.score(rows[:1]) is None and time.monotonic() < deadline:
+            client._down_until = 0.0
+            time.sleep(0.2)
+
+        with open(os.path.join(WORKDIR, 'compiled', 'current.json')) as f:
+            export_path = os.path.join(WORKDIR, 'compiled', json.load(f)['dir'])
+
+        local_scores, local_version = local.score_with_version(rows)
+        service_scores, service_version = service.score_with_version(rows)
+        single = rows[:1]
+        batch = rows[:256]
+        results = {
+            'parity': {
+                'rows': len(rows),
+                'identical_scores': bool(np.array_equal(local_scores, service_scores)),
+                'same_version': local_version == service_version,
+            },
+            'latency_ms': {
+                'single_in_process': median_ms(lambda: local.score_with_version(single), 300),
+                'single_service': median_ms(lambda: service.score_with_version(single), 300),
+                'batch_256_in_process': median_ms(lambda: local.score_with_version(batch), 20),
+                'batch_256_service': median_ms(lambda: service.score_with_version(batch), 20),
+            },
+            'throughput_calls_per_s': {
+                'threads': threads,
+                'in_process': throughput(lambda txs: local.score_with_version(txs), threads, 300, rows),
+                'service': throughput(lambda txs: service.score_with_version(txs), threads, 300, rows),
+            },
+            'memory_kb': {
+                'exported_model': sum(entry.stat().st_size for entry in os.scandir(export_path)) // 1024,
+                'service_master': memory_kb(process.pid),
+                'scorers': [memory_kb(pid) for pid in children(process.pid)],
+            },
+            'client': client.metrics(),
+        }
+        return results
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='procesos puntuadores')
+    parser.add_argument('--threads', type=int, default=4, help='hilos cliente para el rendimiento')
+    parser.add_argument('--train-rows', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    results = run(args.workers, args.threads, args.train_rows)
+    print(json.dumps(results, indent=2))
+    ok = results['parity']['identical_scores'] and results['parity']['same_version']
+    print("✅ Mismos puntajes que en proceso" if ok else "❌ El servicio no coincide con la puntuación en proceso")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
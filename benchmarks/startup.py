@@ -0,0 +1,175 @@
+"""Arranque de la aplicación y de varios workers.
+
+Con un modelo sintético publicado en un MODEL_DIR temporal mide, cada caso
+en un proceso nuevo:
+- cuánto cuesta importar core.app, `create_app()` y la precarga del modelo,
+- la primera puntuación con y sin precarga,
+- N workers creados con fork como gunicorn, con preload_app (el maestro
+  prepara todo antes del fork) y sin él (cada worker importa y carga por su
+  cuenta): tiempo hasta la primera puntuación, memoria propia de cada worker
+  (Private_*) y repartida (Pss), y cuántos quedaron como líder.
+
+Uso: python -m benchmarks.startup [--workers 4] [--train-rows 20000]
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1e3, 2)
+
+
+def memory_kb(pid: int) -> dict:
+    """Memoria propia (Private_Clean + Private_Dirty) y Pss de /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in ('Pss', 'Private_Clean', 'Private_Dirty'):
+                values[name] = int(rest.split()[0])
+    return {'private': values['Private_Clean'] + values['Private_Dirty'], 'pss': values['Pss']}
+
+
+def first_score_ms() -> float:
+    from core.fraud_detection import FraudDetector
+    started = time.perf_counter()
+    scores, version = FraudDetector().score_with_version([{'amount': 1500.0, 'date': '2025-01-01 10:00:00'}])
+    assert version is not None, 'sin modelo'
+    return elapsed_ms(started)
+
+
+def phases(warmup: bool) -> dict:
+    """Proceso nuevo: import, create_app y primera puntuación"""
+    started = time.perf_counter()
+    import core.app
+    results = {'import_ms': elapsed_ms(started)}
+    started = time.perf_counter()
+    core.app.create_app()
+    results['create_app_ms'] = elapsed_ms(started)
+    if warmup:
+        started = time.perf_counter()
+        core.app.warm_up()
+        results['warmup_ms'] = elapsed_ms(started)
+    results['first_score_ms'] = first_score_ms()
+    return results
+
+
+def workers(count: int, preload: bool) -> dict:
+    """Proceso nuevo: fork de `count` workers, con o sin preparar la aplicación en el maestro"""
+    if preload:
+        started = time.perf_counter()
+        import core.app
+        core.app.create_app(warmup=True)
+        gc.collect()
+        gc.freeze()
+        master_ms = elapsed_ms(started)
+    else:
+        master_ms = 0.0
+
+    children = []
+    for _ in range(count):
+        read_fd, write_fd = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            import core.app
+            from core.background import CONTROL_SECONDS
+            from core.database import engine
+            if preload:
+                engine.dispose(close=False)
+            else:
+                core.app.create_app(warmup=True)
+            score_ms = first_score_ms()
+            report = {'ready_ms': elapsed_ms(started), 'first_score_ms': score_ms}
+            core.app.background.start()
+            time.sleep(CONTROL_SECONDS * 4)
+            report['leader'] = core.app.background.is_leader
+            os.write(write_fd, (json.dumps(report) + '\n').encode())
+            signal.pause()
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    reports = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as pipe:
+            report = json.loads(pipe.readline())
+        report.update(memory_kb(pid))
+        reports.append(report)
+    for pid, _ in children:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+    return {
+        'workers': count,
+        'master_ms': master_ms,
+        'ready_ms_max': max(r['ready_ms'] for r in reports),  # del fork a la primera puntuación
+        'first_score_ms_max': max(r['first_score_ms'] for r in reports),
+        'private_mb_per_worker': round(sum(r['private'] for r in reports) / count / 1024, 1),
+        'pss_mb_total': round(sum(r['pss'] for r in reports) / 1024, 1),
+        'leaders': sum(r['leader'] for r in reports),
+    }
+
+
+def run_child(args: list) -> dict:
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', *args],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def prepare(workdir: str, train_rows: int) -> None:
+    """Base vacía y un modelo sintético publicado en el directorio temporal"""
+    os.environ.update(
+        MODEL_DIR=os.path.join(workdir, 'ml'),
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        RUN_DIR=os.path.join(workdir, 'run'),
+    )
+    os.environ.pop('SCORING_SOCKET', None)
+    from sklearn.preprocessing import StandardScaler
+    from benchmarks.forest import synthetic
+    from core.fraud_detection import FEATURES, FraudDetector, model_registry
+
+    X = synthetic(train_rows)
+    scaler = StandardScaler().fit(X)
+    model = FraudDetector()._build_model().fit(scaler.transform(X))
+    model_registry.publish(model, scaler, FEATURES, {'n_samples': train_rows})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--train-rows', type=int, default=20000)
+    parser.add_argument('--phases', choices=['cold', 'warm'], help=argparse.SUPPRESS)
+    parser.add_argument('--fork', choices=['preload', 'lazy'], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.phases:
+        print(json.dumps(phases(args.phases == 'warm')))
+        return 0
+    if args.fork:
+        print(json.dumps(workers(args.workers, args.fork == 'preload')))
+        return 0
+
+    prepare(tempfile.mkdtemp(prefix='startup_bench_'), args.train_rows)
+    results = {
+        'startup_cold': run_child(['--phases', 'cold']),
+        'startup_warm': run_child(['--phases', 'warm']),
+        'workers_preload': run_child(['--fork', 'preload', '--workers', str(args.workers)]),
+        'workers_lazy': run_child(['--fork', 'lazy', '--workers', str(args.workers)]),
+    }
+    print(json.dumps(results, indent=2))
+    ok = results['workers_preload']['leaders'] == 1 and results['workers_lazy']['leaders'] == 1
+    print("✅ Un solo líder por grupo de workers" if ok else "❌ La elección no dejó exactamente un líder")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,28 +1,78 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_file
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_file, Response
 from datetime import datetime, timedelta
-from sqlalchemy import func
 from core.auth import login_user, register_user
-from core.database import init_db, Session
-from core.models import Transaction
-from core.fraud_detection import FraudDetector
-from core.monitoring import TransactionMonitor
-from core.report_generator import ReportGenerator
+from core.database import init_db, ScopedSession
+from core.models import Transaction, VALID_METHODS
+from core.fraud_detection import FraudDetector, model_registry, score_cache
+from core.features import user_features
+from core import rollups
+from core.monitoring import TransactionMonitor, ScoreBackfillJob
+from core.background import BackgroundServices
+from core.events import transaction_events
+from core.streaming import monitoring_events, format_sse, HEARTBEAT_SECONDS, StreamLimitReached
+from core.ingest import BulkIngestor, normalize_amount, iter_csv_records, iter_ndjson_records
+from core.report_generator import ReportGenerator, gzip_stream
+from core.report_jobs import report_jobs, ReportQueueFull, MIMETYPES
+from core.scoring_service import scoring_client
+from core.pagination import parse_page_args, paginate_transactions
+from core.queries import duplicate_transaction_query, recent_transactions_query, report_summary_query
+from core.duplicates import RecentTransactionCache, DUPLICATE_WINDOW_SECONDS, DUPLICATE_AMOUNT_TOLERANCE
+import importlib
 import json
 import secrets
-import threading
-import time
 import os
-import re
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)
+# Con varios workers la clave debe ser la misma en todos: SECRET_KEY o generada antes del fork
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
 
-# Inicializar base de datos
-init_db()
-
-# Configuración del monitor
+# Monitor y recálculo de puntajes: se crean aquí pero solo corren en el proceso líder
 monitor = TransactionMonitor()
-monitor_active = False
+score_backfill = ScoreBackfillJob()
+background = BackgroundServices(monitor, score_backfill)
+
+# Se importan en el primer uso (puntuar, cargas masivas, reportes); warm_up las adelanta
+WARMUP_MODULES = ('numpy', 'pandas', 'sklearn.ensemble', 'sklearn.preprocessing', 'joblib', 'fpdf')
+
+# Caché en memoria para detectar duplicados sin consultar la base (DUPLICATE_CACHE=0 lo desactiva)
+recent_transactions = RecentTransactionCache() if os.environ.get('DUPLICATE_CACHE', '1') != '0' else None
+
+
+def create_app(background_services: bool = True, warmup: bool = False) -> Flask:
+    """Prepara la base (y opcionalmente el modelo) y devuelve la aplicación.
+
+    Importar este módulo no toca la base ni arranca hilos; los servidores
+    llaman a esta función una vez (main.py, wsgi.py). Tampoco arranca los
+    servicios de fondo, así que es segura antes del fork de gunicorn: corren
+    desde `background.start()` o, si nadie lo llamó, desde la primera petición.
+    """
+    init_db()
+    rollups.ensure_populated()
+    if warmup:
+        warm_up()
+    app.config['BACKGROUND_SERVICES'] = background_services
+    return app
+
+
+def warm_up() -> None:
+    """Importa las librerías pesadas y carga el modelo; antes del fork, los workers comparten sus páginas"""
+    for name in WARMUP_MODULES:
+        importlib.import_module(name)
+    scoring_model = model_registry.get()
+    if scoring_model is not None:
+        app.logger.info(f"Modelo {scoring_model.version} precargado")
+
+
+@app.before_request
+def start_background_services():
+    if app.config.get('BACKGROUND_SERVICES'):
+        background.start()
+
+
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    """Devuelve al pool la sesión de la solicitud"""
+    ScopedSession.remove()
 
 
 # --------------------------
@@ -105,96 +155,118 @@ def transactions():
 
     user_data = json.loads(session['user'])
     user_id = user_data['id']
-    db_session = Session()
+    db_session = ScopedSession()
 
     try:
-        transactions_list = db_session.query(Transaction).filter_by(user_id=user_id).all()
-        fraud_detector = FraudDetector()
-        processed_transactions = []
-
-        for tx in transactions_list:
-            tx_data = {
-                'id': tx.id,
-                'amount': tx.amount,
-                'date': tx.date
-            }
-            is_fraud = fraud_detector.detect_fraud(tx_data)
-
-            processed_transactions.append({
-                'id': tx.id,
-                'amount': tx.amount,
-                'date': tx.date,
-                'payment_method': tx.payment_method,
-                'is_fraud': is_fraud
-            })
+        try:
+            page_args = parse_page_args(request.args)
+        except ValueError as e:
+            flash(str(e), "warning")
+            page_args = parse_page_args({})
+
+        transactions_list, next_cursor = paginate_transactions(db_session, user_id, **page_args)
+
+        # El puntaje se calcula al registrar la transacción; aquí solo se lee
+        processed_transactions = [{
+            'id': tx.id,
+            'amount': tx.amount,
+            'date': tx.date,
+            'payment_method': tx.payment_method,
+            'is_fraud': bool(tx.is_flagged)
+        } for tx in transactions_list]
+
+        # Filtros actuales para conservarlos al cambiar de página
+        filters = {key: request.args.get(key) for key in ('start_date', 'end_date', 'method', 'flagged', 'page_size')
+                   if request.args.get(key)}
 
         return render_template('transactions.html',
                                user=user_data,
-                               transactions=processed_transactions)
+                               transactions=processed_transactions,
+                               next_cursor=next_cursor,
+                               filters=filters,
+                               methods=VALID_METHODS)
 
     except Exception as e:
         flash(f"Error al cargar transacciones: {str(e)}", "danger")
         return redirect(url_for('dashboard'))
-    finally:
-        db_session.close()
 
 
 # --------------------------
 # API Endpoints
 # --------------------------
 
-@app.route('/api/transactions', methods=['POST'])
-def add_transaction():
+@app.route('/api/transactions', methods=['GET'])
+def list_transactions():
     if 'user' not in session:
         return jsonify({"error": "Unauthorized"}), 401
 
     user_data = json.loads(session['user'])
-    data = request.get_json()
-    db_session = Session()
+    db_session = ScopedSession()
 
     try:
-        # Validación y normalización del monto
         try:
-            amount_str = str(data.get('amount', '')).strip()
-            clean_amount = re.sub(r'[^\d.,]', '', amount_str)
+            page_args = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-            if not clean_amount:
-                return jsonify({"error": "Monto no puede estar vacío"}), 400
+        transactions_list, next_cursor = paginate_transactions(db_session, user_data['id'], **page_args)
 
-            if ',' in clean_amount:
-                if len(clean_amount.split(',')[-1]) == 2:
-                    clean_amount = clean_amount.replace(',', '.')
-                else:
-                    clean_amount = clean_amount.replace(',', '')
+        return jsonify({
+            "transactions": [{
+                "id": tx.id,
+                "amount": float(tx.amount),
+                "date": tx.date.strftime('%Y-%m-%d %H:%M:%S'),
+                "payment_method": tx.payment_method,
+                "is_flagged": bool(tx.is_flagged),
+                "fraud_score": tx.fraud_score
+            } for tx in transactions_list],
+            "next_cursor": next_cursor,
+            "page_size": page_args['page_size']
+        })
 
-            amount = round(float(clean_amount), 2)
+    except Exception as e:
+        app.logger.error(f"Error listando transacciones: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
 
-            if amount <= 0:
-                return jsonify({"error": "El monto debe ser positivo"}), 400
 
-        except (TypeError, ValueError, AttributeError) as e:
-            return jsonify({"error": f"Formato de monto inválido: {str(e)}"}), 400
+@app.route('/api/transactions', methods=['POST'])
+def add_transaction():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_data = json.loads(session['user'])
+    data = request.get_json()
+    db_session = ScopedSession()
+
+    try:
+        # Validación y normalización del monto
+        try:
+            amount = normalize_amount(data.get('amount', ''))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Validación del método de pago
         method = data.get('method')
-        valid_methods = ["Tarjeta Crédito", "Tarjeta Débito", "Transferencia", "Efectivo"]
-        if not method or method not in valid_methods:
-            return jsonify({"error": f"Método de pago inválido. Use: {', '.join(valid_methods)}"}), 400
+        if not method or method not in VALID_METHODS:
+            return jsonify({"error": f"Método de pago inválido. Use: {', '.join(VALID_METHODS)}"}), 400
 
-        # Verificación de duplicados - Lógica ajustada
+        # Verificación de duplicados: primero en memoria y, si no hay acierto, en la base
         now = datetime.now()
-        time_threshold = now - timedelta(minutes=1)  # Aumentamos el umbral de tiempo a 1 minuto
-        amount_tolerance = 0.05  # Aumentamos la tolerancia del monto
-
-        duplicate = db_session.query(Transaction).filter(
-            Transaction.user_id == user_data['id'],
-            func.abs(Transaction.amount - amount) < amount_tolerance,
-            Transaction.payment_method == method,
-            Transaction.date >= time_threshold
-        ).first()
-
-        if duplicate:
-            time_diff = (now - duplicate.date).total_seconds()
+        time_threshold = now - timedelta(seconds=DUPLICATE_WINDOW_SECONDS)
+
+        duplicate_date = None
+        if recent_transactions is not None:
+            cached = recent_transactions.find_similar(user_data['id'], amount, method, time_threshold)
+            duplicate_date = cached['date'] if cached else None
+
+        if duplicate_date is None:
+            duplicate = duplicate_transaction_query(
+                db_session, user_data['id'], amount, method, time_threshold, DUPLICATE_AMOUNT_TOLERANCE
+            ).first()
+            duplicate_date = duplicate.date if duplicate else None
+
+        if duplicate_date is not None:
+            time_diff = (now - duplicate_date).total_seconds()
             return jsonify({
                 "success": False,
                 "duplicate": True,
@@ -210,9 +282,22 @@ def add_transaction():
             is_flagged=False
         )
 
+        # Features del historial del usuario (O(1)) y puntaje antes de guardar;
+        # si el modelo no está disponible, el proceso de relleno la evaluará después
+        user_features.observe(db_session, [new_transaction])
+        FraudDetector().score_transactions([new_transaction])
+        rollups.record_inserts(db_session, [new_transaction])
+
         db_session.add(new_transaction)
         db_session.commit()
 
+        if recent_transactions is not None:
+            recent_transactions.add(user_data['id'], new_transaction.id, amount, method, now)
+
+        # Avisar al monitor sin bloquear la respuesta (en otro worker lo recupera su pasada)
+        if background.is_leader:
+            transaction_events.publish(new_transaction.id)
+
         return jsonify({
             "success": True,
             "transaction": {
@@ -220,7 +305,8 @@ def add_transaction():
                 "amount": float(new_transaction.amount),
                 "date": new_transaction.date.strftime('%Y-%m-%d %H:%M:%S'),
                 "payment_method": new_transaction.payment_method,
-                "is_flagged": False
+                "is_flagged": bool(new_transaction.is_flagged),
+                "fraud_score": new_transaction.fraud_score
             },
             "message": "Transacción registrada exitosamente"
         })
@@ -229,8 +315,43 @@ def add_transaction():
         db_session.rollback()
         app.logger.error(f"Error adding transaction: {str(e)}")
         return jsonify({"error": f"Error interno del servidor: {str(e)}"}), 500
+
+@app.route('/api/transactions/bulk', methods=['POST'])
+def bulk_add_transactions():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_data = json.loads(session['user'])
+    upload_format = (request.args.get('format') or '').lower()
+    if not upload_format:
+        upload_format = 'ndjson' if request.mimetype in ('application/x-ndjson', 'application/jsonl') else 'csv'
+    if upload_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "Formato no soportado. Use CSV o NDJSON"}), 400
+
+    # Se lee el cuerpo como stream: nunca se carga el archivo completo en memoria
+    if upload_format == 'csv':
+        records = iter_csv_records(request.stream)
+    else:
+        records = iter_ndjson_records(request.stream)
+
+    db_session = ScopedSession()
+    ingestor = BulkIngestor(db_session, user_data['id'])
+
+    try:
+        result = ingestor.ingest(records)
+        return jsonify({"success": True, **result})
+
+    except UnicodeDecodeError as e:
+        return jsonify({"error": f"Codificación inválida (use UTF-8): {str(e)}",
+                        "summary": ingestor.summary}), 400
+    except Exception as e:
+        app.logger.error(f"Error en carga masiva: {str(e)}")
+        return jsonify({"error": f"Error interno del servidor: {str(e)}", "summary": ingestor.summary}), 500
     finally:
-        db_session.close()
+        # Avisar al monitor de lo que sí se insertó
+        if background.is_leader:
+            for tx_id in ingestor.inserted_ids:
+                transaction_events.publish(tx_id)
 
 # --------------------------
 # API para Monitoreo en Tiempo Real
@@ -238,14 +359,12 @@ def add_transaction():
 
 @app.route('/api/monitoring/start', methods=['POST'])
 def start_monitoring():
-    global monitor_active
-
     if 'user' not in session:
         return jsonify({"error": "Unauthorized"}), 401
 
-    if not monitor_active:
-        monitor_active = True
-        threading.Thread(target=run_monitoring).start()
+    active, _ = background.monitoring_status()
+    if not active:
+        background.set_monitoring(True)
         return jsonify({"status": "started"})
 
     return jsonify({"status": "already_running"})
@@ -253,14 +372,79 @@ def start_monitoring():
 
 @app.route('/api/monitoring/stop', methods=['POST'])
 def stop_monitoring():
-    global monitor_active
-    monitor_active = False
+    background.set_monitoring(False)
     return jsonify({"status": "stopped"})
 
 
 @app.route('/api/monitoring/status')
 def monitoring_status():
-    return jsonify({"active": monitor_active})
+    active, metrics = background.monitoring_status()
+    metrics['stream_clients'] = monitoring_events.client_count()
+    metrics['stream_rejected'] = monitoring_events.rejected
+    return jsonify({"active": active, "metrics": metrics})
+
+
+# --------------------------
+# API del Modelo
+# --------------------------
+
+@app.route('/api/model/train', methods=['POST'])
+def train_model():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    if json.loads(session['user']).get('role') != 'admin':
+        return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+    if not background.request_training(full=bool(data.get('full'))):
+        return jsonify({"status": "already_running", "training": background.training_status()}), 409
+    return jsonify({"status": "queued", "training": background.training_status()}), 202
+
+
+@app.route('/api/model/status')
+def model_status():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    status = background.training_status()
+    status['score_cache'] = score_cache.metrics()
+    status['scoring_service'] = scoring_client.metrics() if scoring_client else None
+    return jsonify(status)
+
+
+@app.route('/api/monitoring/stream')
+def monitoring_stream():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_data = json.loads(session['user'])
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    # Cada cliente ocupa un hilo del worker: por encima del límite el
+    # dashboard vuelve a consultar periódicamente
+    try:
+        subscription = monitoring_events.subscribe(user_data['id'], last_event_id)
+    except StreamLimitReached as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '30'}
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                events = subscription.wait(timeout=HEARTBEAT_SECONDS)
+                if not events:
+                    yield ": heartbeat\n\n"
+                    continue
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            monitoring_events.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api/monitoring/transactions')
@@ -269,61 +453,58 @@ def get_recent_transactions():
         return jsonify({"error": "Unauthorized"}), 401
 
     user_data = json.loads(session['user'])
-    db_session = Session()
+    db_session = ScopedSession()
 
     try:
-        transactions = db_session.query(Transaction) \
-            .filter_by(user_id=user_data['id']) \
-            .order_by(Transaction.date.desc()) \
-            .limit(5) \
-            .all()
-
-        fraud_detector = FraudDetector()
-        result = []
-
-        for tx in transactions:
-            tx_data = {
-                'id': tx.id,
-                'amount': float(tx.amount),
-                'date': tx.date.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            is_fraud = bool(fraud_detector.detect_fraud(tx_data))
-
-            result.append({
-                'id': tx.id,
-                'amount': float(tx.amount),
-                'date': tx.date.strftime('%Y-%m-%d %H:%M:%S'),
-                'payment_method': tx.payment_method,
-                'is_fraud': is_fraud
-            })
+        transactions = recent_transactions_query(db_session, user_data['id'], limit=5).all()
+
+        result = [{
+            'id': tx.id,
+            'amount': float(tx.amount),
+            'date': tx.date.strftime('%Y-%m-%d %H:%M:%S'),
+            'payment_method': tx.payment_method,
+            'is_fraud': bool(tx.is_flagged)
+        } for tx in transactions]
 
         return jsonify({"transactions": result})
 
     except Exception as e:
         app.logger.error(f"Error en get_recent_transactions: {str(e)}")
         return jsonify({"error": "Error interno del servidor"}), 500
-    finally:
-        db_session.close()
 
 
-def run_monitoring():
-    global monitor_active
-    db_session = Session()
-    fraud_detector = FraudDetector()
+@app.route('/api/summary')
+def get_summary():
+    """Totales del usuario en un rango de días, desde el resumen diario"""
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
 
+    user_data = json.loads(session['user'])
     try:
-        while monitor_active:
-            new_transactions = monitor.detect_new_transactions()
-            for tx in new_transactions:
-                tx_data = {
-                    'id': tx.id,
-                    'amount': tx.amount,
-                    'date': tx.date
-                }
-                is_fraud = fraud_detector.detect_fraud(tx_data)
-            time.sleep(5)
-    finally:
-        db_session.close()
+        start_date = datetime.strptime(request.args.get('startDate', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('endDate', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Formato de fecha inválido. Use YYYY-MM-DD"}), 400
+
+    db_session = ScopedSession()
+    try:
+        summary = report_summary_query(db_session, user_data['id'], start_date, end_date).one()
+        by_method = report_summary_query(db_session, user_data['id'], start_date, end_date, group_by='method').all()
+        return jsonify({
+            "count": int(summary.count),
+            "total": float(summary.total),
+            "average": float(summary.average or 0),
+            "flagged": int(summary.flagged),
+            "by_method": [{
+                "payment_method": row.payment_method,
+                "count": int(row.count),
+                "total": float(row.total),
+                "flagged": int(row.flagged)
+            } for row in by_method]
+        })
+    except Exception as e:
+        app.logger.error(f"Error en get_summary: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
 
 
 # --------------------------
@@ -337,7 +518,6 @@ def generate_report():
 
     user_data = json.loads(session['user'])
     data = request.get_json()
-    db_session = Session()
 
     try:
         # Validación de fechas
@@ -359,31 +539,42 @@ def generate_report():
         if report_format not in ['pdf', 'csv']:
             return jsonify({"error": "Formato no soportado. Use PDF o CSV"}), 400
 
-        # Generar reporte
+        # Por defecto se encola y el cliente consulta GET /api/reports/<id>
+        if data.get('async', True):
+            try:
+                job = report_jobs.submit(user_data['id'], data['startDate'], data['endDate'], report_format)
+            except ReportQueueFull as e:
+                return jsonify({"error": str(e)}), 503
+            return jsonify(_report_job_json(job)), 202
+
+        # Modo directo: generar en la petición
         report_generator = ReportGenerator()
+        filename = f"reporte_{data['startDate']}_a_{data['endDate']}.{report_format}"
 
-        if report_format == 'pdf':
-            report_path = report_generator.generate_pdf_report(
-                user_id=user_data['id'],
-                start_date=data['startDate'],
-                end_date=data['endDate']
-            )
-            mimetype = 'application/pdf'
-        else:
-            report_path = report_generator.generate_csv_report(
+        if report_format == 'csv':
+            # Se envía mientras se lee la base: sin archivo temporal y con memoria constante
+            chunks = report_generator.iter_csv_report(
                 user_id=user_data['id'],
                 start_date=data['startDate'],
                 end_date=data['endDate']
             )
-            mimetype = 'text/csv'
+            headers = {'Content-Disposition': f'attachment; filename="{filename}"', 'Vary': 'Accept-Encoding'}
+            if data.get('compress', True) and 'gzip' in request.accept_encodings:
+                headers['Content-Encoding'] = 'gzip'
+                chunks = gzip_stream(chunks)
+            return Response(chunks, mimetype='text/csv', headers=headers)
+
+        report_path = report_generator.generate_pdf_report(
+            user_id=user_data['id'],
+            start_date=data['startDate'],
+            end_date=data['endDate']
+        )
+        mimetype = 'application/pdf'
 
         # Verificar que el archivo se creó
         if not os.path.exists(report_path):
             return jsonify({"error": "Error al generar el archivo de reporte"}), 500
 
-        # Obtener nombre del archivo
-        filename = f"reporte_{data['startDate']}_a_{data['endDate']}.{report_format}"
-
         return send_file(
             report_path,
             as_attachment=True,
@@ -394,8 +585,43 @@ def generate_report():
     except Exception as e:
         app.logger.error(f"Error generando reporte: {str(e)}")
         return jsonify({"error": f"Error interno al generar reporte: {str(e)}"}), 500
-    finally:
-        db_session.close()
+
+
+def _report_job_json(job):
+    return {
+        "job_id": job['id'],
+        "status": job['status'],
+        "progress": job['progress'],
+        "cached": job['cached'],
+        "error": job['error'],
+        "created_at": job['created_at'],
+        "finished_at": job['finished_at'],
+        "status_url": url_for('report_status', job_id=job['id'])
+    }
+
+
+@app.route('/api/reports/<job_id>')
+def report_status(job_id):
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_data = json.loads(session['user'])
+    job = report_jobs.get(job_id, user_data['id'])
+    if job is None:
+        return jsonify({"error": "Reporte no encontrado"}), 404
+
+    if job['status'] == 'done':
+        return send_file(
+            job['path'],
+            as_attachment=True,
+            download_name=f"reporte_{job['start_date']}_a_{job['end_date']}.{job['format']}",
+            mimetype=MIMETYPES[job['format']]
+        )
+    if job['status'] == 'failed':
+        return jsonify(_report_job_json(job)), 500
+    if job['status'] == 'expired':
+        return jsonify(_report_job_json(job)), 410
+    return jsonify(_report_job_json(job)), 202
 
 
 if __name__ == "__main__":
@@ -0,0 +1,280 @@
+"""Servicios de fondo de un solo proceso por instalación.
+
+Con varios workers (gunicorn) cada proceso carga la aplicación, pero el
+monitor, el relleno de puntajes y el entrenamiento deben correr una sola vez.
+Los workers compiten por un candado de archivo (flock) en RUN_DIR: el que lo
+obtiene queda como líder y arranca esos servicios; si el proceso muere, el
+sistema operativo libera el candado y otro worker toma su lugar.
+
+Los demás workers se comunican con el líder mediante archivos en RUN_DIR:
+- monitor.desired: estado pedido para el monitor ("on" u "off"),
+- train.request: entrenamiento pendiente,
+- status.json: métricas del monitor y del entrenamiento publicadas por el líder,
+- events.ndjson: eventos del monitor, que cada worker reenvía a sus clientes SSE.
+El monitor guarda además en monitor.watermark el último id revisado, para que
+un líder nuevo retome desde ahí (core.monitoring).
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from typing import Optional, Tuple
+from core.database import DATA_DIR
+from core.fraud_detection import model_trainer
+from core.streaming import monitoring_events
+
+RUN_DIR = os.environ.get('RUN_DIR', os.path.join(DATA_DIR, 'run'))
+LEADER_RETRY_SECONDS = float(os.environ.get('LEADER_RETRY_SECONDS', 5))
+CONTROL_SECONDS = float(os.environ.get('BACKGROUND_CONTROL_SECONDS', 0.5))  # también es la demora de los eventos SSE
+STATUS_STALE_SECONDS = 10  # sin novedades del líder por más tiempo se lo considera caído
+EVENT_LOG_MAX_BYTES = 4 * 1024 * 1024  # al superarlo el líder rota events.ndjson
+
+
+def _write_atomic(path: str, content: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class BackgroundServices:
+    """Elige un proceso líder y expone el monitor y el entrenamiento a todos los workers"""
+
+    def __init__(self, monitor, backfill, trainer=model_trainer, events=monitoring_events,
+                 run_dir: str = RUN_DIR):
+        self.monitor = monitor
+        self.backfill = backfill
+        self.trainer = trainer
+        self.events = events
+        self.run_dir = run_dir
+        self.lock_path = os.path.join(run_dir, 'leader.lock')
+        self.desired_path = os.path.join(run_dir, 'monitor.desired')
+        self.train_path = os.path.join(run_dir, 'train.request')
+        self.status_path = os.path.join(run_dir, 'status.json')
+        self.events_path = os.path.join(run_dir, 'events.ndjson')
+        self.is_leader = False
+        self.running = False
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = None  # threading.Event del bucle en curso
+        self._lock_file = None
+        self._event_log = None  # líder: archivo donde agrega los eventos
+        self._event_tail = None  # seguidor: (archivo, inodo) que está leyendo
+        self._tail_start = None  # (inodo, tamaño) de events.ndjson al arrancar
+
+    def start(self) -> None:
+        """Arranca la elección en este proceso; es idempotente y se repite tras un fork.
+
+        Debe llamarse en el proceso que atiende las peticiones (después del
+        fork de gunicorn), nunca en el maestro: el candado se hereda con el fork.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.is_leader = False
+            self._lock_file = self._event_log = self._event_tail = None
+            self._stopped = threading.Event()
+            self.running = True
+        os.makedirs(self.run_dir, exist_ok=True)
+        try:
+            st = os.stat(self.events_path)
+            self._tail_start = (st.st_ino, st.st_size)  # los eventos anteriores al arranque no se reenvían
+        except FileNotFoundError:
+            self._tail_start = None
+        self.trainer.forward = self.request_training
+        thread = threading.Thread(target=self._loop, args=(self._stopped,), name='background-services')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self) -> None:
+        """Detiene los servicios y libera el liderazgo"""
+        with self._lock:
+            if self._stopped is not None:
+                self._stopped.set()
+            self.running = False
+            if self.is_leader:
+                self.monitor.stop_monitoring()
+                self.backfill.stop()
+                self.is_leader = False
+                self._lock_file.close()
+            if self._event_log is not None:
+                self._event_log.close()
+            self._pid = self._stopped = self._event_log = None
+
+    # ---- API para las rutas ----
+
+    def set_monitoring(self, active: bool) -> None:
+        """Pide encender o apagar el monitor; el líder lo aplica en su siguiente ciclo"""
+        os.makedirs(self.run_dir, exist_ok=True)
+        _write_atomic(self.desired_path, 'on' if active else 'off')
+        if self.is_leader:
+            self._apply_desired()
+
+    def monitoring_status(self) -> Tuple[bool, dict]:
+        """(activo, métricas) del monitor, estén en este proceso o en el líder"""
+        if self.is_leader:
+            return self.monitor.running, self.monitor.metrics()
+        # El pedido vale como estado mientras haya líder: lo aplica en menos de un ciclo
+        status = self._leader_status()
+        metrics = dict(status.get('monitor') or {})
+        metrics['leader_pid'] = status.get('pid')
+        return bool(status) and self._desired(), metrics
+
+    def request_training(self, full: bool = False) -> bool:
+        """Programa un entrenamiento en el líder; devuelve False si ya hay uno en curso"""
+        if self.is_leader:
+            return self.trainer.submit(full=full)
+        if self.training_status()['state'] in ('queued', 'running') or os.path.exists(self.train_path):
+            return False
+        _write_atomic(self.train_path, json.dumps({'full': full}))
+        return True
+
+    def training_status(self) -> dict:
+        """Estado del entrenamiento visto desde cualquier worker"""
+        status = self.trainer.status()
+        if not self.is_leader:
+            status.update(self._leader_status().get('training') or {})
+            if os.path.exists(self.train_path):
+                status['state'] = 'queued'
+        return status
+
+    # ---- bucle de cada proceso ----
+
+    def _loop(self, stopped: threading.Event):
+        next_attempt = 0.0
+        while not stopped.is_set():
+            try:
+                if self.is_leader:
+                    self._lead()
+                else:
+                    self._follow_events()
+                    if time.monotonic() >= next_attempt:
+                        next_attempt = time.monotonic() + LEADER_RETRY_SECONDS
+                        if self._acquire():
+                            self._become_leader()
+            except Exception as e:
+                print(f"Error en servicios de fondo: {e}")
+            stopped.wait(CONTROL_SECONDS)
+
+    def _acquire(self) -> bool:
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _become_leader(self) -> None:
+        # Reenviar lo que quedó del líder anterior para seguir su numeración de eventos
+        self._follow_events()
+        if self._event_tail is not None:
+            self._event_tail[0].close()
+            self._event_tail = None
+        self.is_leader = True
+        self.trainer.forward = None
+        self.monitor.callback = self._publish
+        self.backfill.start()
+        print(f"Proceso {os.getpid()}: líder de los servicios de fondo")
+        self._lead()
+
+    def _lead(self) -> None:
+        """Aplica los pedidos de los demás workers y publica el estado"""
+        self._apply_desired()
+        request = _read(self.train_path)
+        if request is not None:
+            os.remove(self.train_path)
+            try:
+                full = bool(json.loads(request).get('full'))
+            except ValueError:
+                full = False
+            self.trainer.submit(full=full)
+
+        status = {
+            'pid': os.getpid(),
+            'updated_at': time.time(),
+            'monitor': self.monitor.metrics(),
+            'training': {name: value for name, value in self.trainer.status().items()
+                         if name in ('state', 'full', 'started_at', 'finished_at', 'error')},
+        }
+        _write_atomic(self.status_path, json.dumps(status, default=str))
+
+    def _desired(self) -> bool:
+        return (_read(self.desired_path) or 'off').strip() == 'on'
+
+    def _apply_desired(self) -> None:
+        active = self._desired()
+        if active and not self.monitor.running:
+            self.monitor.start_monitoring(callback=self._publish)
+        elif not active and self.monitor.running:
+            self.monitor.stop_monitoring()
+
+    def _leader_status(self) -> dict:
+        try:
+            status = json.loads(_read(self.status_path) or '{}')
+        except ValueError:
+            return {}
+        if time.time() - status.get('updated_at', 0) > STATUS_STALE_SECONDS:
+            return {}
+        return status
+
+    # ---- eventos del monitor ----
+
+    def _publish(self, tx) -> None:
+        """Callback del monitor en el líder: publica localmente y deja el evento a los demás workers"""
+        events = self.events.publish_transaction(tx)
+        if self._event_log is None:
+            self._event_log = open(self.events_path, 'a')
+        for event in events:
+            self._event_log.write(json.dumps({'user_id': tx.user_id, **event}) + '\n')
+        self._event_log.flush()
+
+        if self._event_log.tell() > EVENT_LOG_MAX_BYTES:
+            self._event_log.close()
+            os.replace(self.events_path, f"{self.events_path}.1")
+            self._event_log = None
+
+    def _follow_events(self) -> None:
+        """Reenvía a los clientes de este proceso los eventos nuevos del líder (como `tail -F`)"""
+        if self._event_tail is None:
+            try:
+                handle = open(self.events_path)
+            except FileNotFoundError:
+                return
+            inode = os.fstat(handle.fileno()).st_ino
+            if self._tail_start is not None and self._tail_start[0] == inode:
+                handle.seek(self._tail_start[1])
+            self._event_tail = (handle, inode)
+
+        handle, inode = self._event_tail
+        while True:
+            position = handle.tell()
+            line = handle.readline()
+            if not line:
+                break
+            if not line.endswith('\n'):  # línea a medio escribir
+                handle.seek(position)
+                break
+            event = json.loads(line)
+            self.events.publish(event['user_id'], event['event'], event['data'], event_id=event['id'])
+
+        # Rotación: terminado el archivo viejo, seguir el nuevo desde el principio
+        try:
+            rotated = os.stat(self.events_path).st_ino != inode
+        except FileNotFoundError:
+            rotated = False
+        if rotated:
+            handle.close()
+            handle = open(self.events_path)
+            self._event_tail = (handle, os.fstat(handle.fileno()).st_ino)
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+DUPLICATE_WINDOW_SECONDS = 60
+DUPLICATE_AMOUNT_TOLERANCE = 0.05
+
+
+def is_similar(amount: float, method: str, other_amount: float, other_method: str,
+               tolerance: float = DUPLICATE_AMOUNT_TOLERANCE) -> bool:
+    """Misma regla que `duplicate_transaction_query`: mismo método y monto a menos de `tolerance`"""
+    return other_method == method and abs(other_amount - amount) < tolerance
+
+
+def duplicate_windows(dates: Iterable[datetime],
+                      window_seconds: int = DUPLICATE_WINDOW_SECONDS) -> List[Tuple[datetime, datetime]]:
+    """Intervalos (inicio, fin) que cubren ±window_seconds alrededor de cada fecha, unidos si se solapan"""
+    window = timedelta(seconds=window_seconds)
+    intervals = []
+    for date in sorted(set(dates)):
+        if intervals and date - window <= intervals[-1][1]:
+            intervals[-1][1] = date + window
+        else:
+            intervals.append([date - window, date + window])
+    return [(start, end) for start, end in intervals]
+
+
+class RecentTransactionCache:
+    """Últimas transacciones de cada usuario en memoria.
+
+    Permite responder "¿hubo una transacción similar en el último minuto?"
+    sin consultar SQLite. Un acierto es definitivo; si no hay acierto, quien
+    llama debe verificar en la base de datos, porque el caché puede no tener
+    las transacciones registradas por otros procesos o antes del arranque.
+    """
+
+    def __init__(self, max_per_user: int = 32, max_users: int = 10000,
+                 window_seconds: int = DUPLICATE_WINDOW_SECONDS):
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self.window_seconds = window_seconds
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def find_similar(self, user_id: int, amount: float, method: str, since: datetime,
+                     tolerance: float = DUPLICATE_AMOUNT_TOLERANCE) -> Optional[dict]:
+        """Devuelve la transacción similar más reciente registrada desde `since`, si la hay"""
+        with self._lock:
+            recent = self._users.get(user_id)
+            if recent:
+                self._users.move_to_end(user_id)
+                for tx in reversed(recent):
+                    if tx['date'] < since:
+                        break
+                    if is_similar(amount, method, tx['amount'], tx['payment_method'], tolerance):
+                        self.hits += 1
+                        return tx
+            self.misses += 1
+            return None
+
+    def add(self, user_id: int, tx_id: int, amount: float, method: str, date: datetime) -> None:
+        """Registra una transacción recién guardada"""
+        with self._lock:
+            recent = self._users.get(user_id)
+            if recent is None:
+                recent = self._users[user_id] = deque(maxlen=self.max_per_user)
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            recent.append({'id': tx_id, 'amount': amount, 'payment_method': method, 'date': date})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
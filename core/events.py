@@ -0,0 +1,61 @@
+import queue
+import threading
+import time
+from typing import List, Tuple
+
+EVENT_QUEUE_SIZE = 10000
+
+
+class TransactionEventBus:
+    """Cola acotada en proceso con los IDs de las transacciones recién registradas.
+
+    `add_transaction` publica sin bloquear; si la cola está llena el evento se
+    descarta y el monitor lo recupera en su siguiente pasada contra la base.
+    """
+
+    def __init__(self, maxsize: int = EVENT_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, tx_id: int) -> bool:
+        """Encola el ID de una transacción nueva; devuelve False si se descartó"""
+        try:
+            self._queue.put_nowait((tx_id, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.published += 1
+        return True
+
+    def drain(self, max_items: int, timeout: float) -> List[Tuple[int, float]]:
+        """Espera hasta `timeout` por el primer evento y devuelve hasta `max_items` (id, publicado_en)"""
+        try:
+            events = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while len(events) < max_items:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'queue_depth': self.depth(),
+                'queue_capacity': self._queue.maxsize,
+                'published': self.published,
+                'dropped': self.dropped
+            }
+
+
+transaction_events = TransactionEventBus()
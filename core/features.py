@@ -0,0 +1,180 @@
+"""Features de comportamiento por usuario.
+
+Cada usuario tiene una fila en `user_feature_state` con conteo, suma y suma
+de cuadrados de sus montos para tres ventanas (1h, 24h, 30d) y el conteo por
+método de pago. Los agregados decaen exponencialmente con la constante de
+tiempo de cada ventana, así que se actualizan en O(1) por transacción sin
+leer el historial. Antes de incorporar una transacción se guarda en ella una
+copia de los agregados (`BEHAVIOR_FEATURES`) para que el modelo la compare
+con el historial previo del usuario.
+
+Uso: python -m core.features rebuild
+"""
+import argparse
+import math
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from core.database import Session
+from core.models import BEHAVIOR_FEATURES, Transaction, UserFeatureState
+
+WINDOWS = {'1h': 3600.0, '24h': 86400.0, '30d': 30 * 86400.0}  # constante de decaimiento en segundos
+MAX_SECONDS_SINCE_LAST = WINDOWS['30d']  # también se usa para la primera transacción del usuario
+
+# Valor de cada feature cuando la transacción no tiene historial calculado
+BEHAVIOR_DEFAULTS = {name: 0.0 for name in BEHAVIOR_FEATURES}
+BEHAVIOR_DEFAULTS['user_seconds_since_last'] = MAX_SECONDS_SINCE_LAST
+
+_STATE = UserFeatureState.__table__
+
+
+def new_state(user_id: int) -> UserFeatureState:
+    state = UserFeatureState(user_id=user_id, last_date=None, method_counts={})
+    for window in WINDOWS:
+        setattr(state, f'count_{window}', 0.0)
+        setattr(state, f'sum_{window}', 0.0)
+        setattr(state, f'sumsq_{window}', 0.0)
+    return state
+
+
+def snapshot(state: UserFeatureState, date: datetime, method: str) -> Dict[str, float]:
+    """Features de una transacción en `date` según el historial previo del usuario"""
+    elapsed = (date - state.last_date).total_seconds() if state.last_date is not None else None
+    features = {}
+    for window, tau in WINDOWS.items():
+        # Una transacción anterior a la última registrada ve los agregados sin decaer
+        decay = math.exp(-elapsed / tau) if elapsed is not None and elapsed > 0 else 1.0
+        count = (getattr(state, f'count_{window}') or 0.0) * decay
+        total = (getattr(state, f'sum_{window}') or 0.0) * decay
+        sumsq = (getattr(state, f'sumsq_{window}') or 0.0) * decay
+        mean = total / count if count > 0 else 0.0
+        features[f'user_count_{window}'] = count
+        features[f'user_sum_{window}'] = total
+        features[f'user_mean_{window}'] = mean
+        features[f'user_std_{window}'] = math.sqrt(max(sumsq / count - mean * mean, 0.0)) if count > 0 else 0.0
+
+    # Conteos por método y total decaen igual: la proporción no depende de `date`
+    features['user_method_freq_30d'] = (state.method_counts or {}).get(method, 0.0) / state.count_30d \
+        if state.count_30d else 0.0
+    features['user_seconds_since_last'] = min(max(elapsed, 0.0), MAX_SECONDS_SINCE_LAST) \
+        if elapsed is not None else MAX_SECONDS_SINCE_LAST
+    return features
+
+
+def apply(state: UserFeatureState, amount: float, date: datetime, method: str) -> None:
+    """Incorpora una transacción a los agregados del usuario"""
+    elapsed = (date - state.last_date).total_seconds() if state.last_date is not None else 0.0
+    method_counts = dict(state.method_counts or {})
+    for window, tau in WINDOWS.items():
+        if elapsed >= 0:
+            # Transacción nueva: decaer lo acumulado hasta `date` y sumarla con peso 1
+            decay, weight = math.exp(-elapsed / tau), 1.0
+        else:
+            # Llega fuera de orden: se suma con el peso que tendría hoy
+            decay, weight = 1.0, math.exp(elapsed / tau)
+        setattr(state, f'count_{window}', (getattr(state, f'count_{window}') or 0.0) * decay + weight)
+        setattr(state, f'sum_{window}', (getattr(state, f'sum_{window}') or 0.0) * decay + weight * amount)
+        setattr(state, f'sumsq_{window}', (getattr(state, f'sumsq_{window}') or 0.0) * decay
+                + weight * amount * amount)
+        if window == '30d':
+            method_counts = {key: value * decay for key, value in method_counts.items()}
+            method_counts[method] = method_counts.get(method, 0.0) + weight
+
+    state.method_counts = method_counts
+    if elapsed >= 0:
+        state.last_date = date
+
+
+class UserFeatureStore:
+    """Mantiene `user_feature_state` y calcula las features de cada transacción nueva"""
+
+    def _states(self, db_session, user_ids: Iterable[int]) -> Dict[int, UserFeatureState]:
+        """Estado de cada usuario, bloqueado hasta el commit de la sesión.
+
+        Las filas que faltan se crean con un upsert (ON CONFLICT DO NOTHING), así
+        dos primeras transacciones simultáneas de un usuario no chocan. Cada
+        actualización lee y reescribe los agregados, por eso se serializa por
+        usuario: en PostgreSQL con SELECT ... FOR UPDATE y en SQLite porque el
+        INSERT ya tomó el candado de escritura antes de leer.
+        """
+        user_ids = sorted(set(user_ids))  # mismo orden en todas las sesiones: sin interbloqueos
+        connection = db_session.connection()
+        dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+        connection.execute(dialect.insert(_STATE).on_conflict_do_nothing(index_elements=[_STATE.c.user_id]),
+                           [{'user_id': user_id} for user_id in user_ids])
+
+        query = db_session.query(UserFeatureState).filter(UserFeatureState.user_id.in_(user_ids)) \
+            .order_by(UserFeatureState.user_id).populate_existing()
+        if dialect is postgresql:
+            query = query.with_for_update()
+        return {state.user_id: state for state in query}
+
+    def observe(self, db_session, transactions: List[Transaction]) -> None:
+        """Guarda las features en cada `Transaction` y actualiza los agregados en la misma sesión"""
+        states = self._states(db_session, {tx.user_id for tx in transactions})
+        for tx in sorted(transactions, key=lambda tx: tx.id or 0):
+            state = states[tx.user_id]
+            for name, value in snapshot(state, tx.date, tx.payment_method).items():
+                setattr(tx, name, value)
+            apply(state, tx.amount, tx.date, tx.payment_method)
+
+    def observe_rows(self, db_session, user_id: int, rows: List[Dict]) -> None:
+        """Igual que `observe` para filas (dicts con amount, date y payment_method) de un usuario"""
+        state = self._states(db_session, [user_id])[user_id]
+        for row in rows:
+            row.update(snapshot(state, row['date'], row['payment_method']))
+            apply(state, row['amount'], row['date'], row['payment_method'])
+
+    def rebuild(self, db_session=None, chunk_size: Optional[int] = None) -> int:
+        """Recalcula agregados y features de todas las transacciones en orden de registro"""
+        from core.loader import LOAD_CHUNK_SIZE, iter_transaction_chunks  # pandas solo para la reconstrucción
+        own_session = db_session is None
+        db_session = db_session or Session()
+        states = {}
+        total = 0
+        try:
+            columns = ('id', 'user_id', 'amount', 'date', 'payment_method')
+            # Montos en float64: los agregados deben coincidir con los calculados al registrar
+            for chunk in iter_transaction_chunks(db_session, columns, chunk_size or LOAD_CHUNK_SIZE,
+                                                 dtypes={'amount': 'float64'}):
+                values = []
+                for tx_id, user_id, amount, date, method in zip(
+                        chunk['id'].tolist(), chunk['user_id'].tolist(), chunk['amount'].tolist(),
+                        chunk['date'].to_numpy().tolist(), chunk['payment_method'].tolist()):
+                    state = states.get(user_id)
+                    if state is None:
+                        state = states[user_id] = new_state(user_id)
+                    values.append({'id': tx_id, **snapshot(state, date, method)})
+                    apply(state, amount, date, method)
+                db_session.execute(update(Transaction), values)
+                total += len(values)
+
+            db_session.execute(delete(UserFeatureState))
+            db_session.add_all(states.values())
+            db_session.commit()
+            return total
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            if own_session:
+                db_session.close()
+
+
+user_features = UserFeatureStore()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['rebuild'])
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        total = user_features.rebuild()
+        print(f"✅ Features de comportamiento recalculadas para {total} transacciones")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
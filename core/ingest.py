@@ -0,0 +1,270 @@
+from __future__ import annotations  # pandas se importa al procesar el primer bloque
+import bisect
+import codecs
+import csv
+import json
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List
+from sqlalchemy import insert
+from core import rollups
+from core.duplicates import DUPLICATE_WINDOW_SECONDS, duplicate_windows, is_similar
+from core.features import user_features
+from core.fraud_detection import FraudDetector
+from core.models import Transaction, VALID_METHODS
+from core.queries import nearby_transactions_query
+
+BULK_CHUNK_SIZE = 1000  # filas por lote de validación, puntuación e inserción
+BULK_MAX_ROW_RESULTS = 1000  # filas con detalle en la respuesta; del resto solo se cuentan
+DUPLICATE_LOOKUP_BATCH = 100  # intervalos por consulta de duplicados (3 parámetros cada uno)
+
+
+def normalize_amount(value) -> float:
+    """Normaliza un monto escrito por el usuario ("1.500,50", "1,500.50", "$ 20000") a float.
+
+    Lanza ValueError con el mensaje que se devuelve al cliente.
+    """
+    try:
+        amount_str = str(value if value is not None else '').strip()
+        clean_amount = re.sub(r'[^\d.,]', '', amount_str)
+
+        if not clean_amount:
+            raise ValueError("Monto no puede estar vacío")
+
+        if ',' in clean_amount:
+            if len(clean_amount.split(',')[-1]) == 2:
+                # Coma decimal: los puntos son separadores de miles
+                clean_amount = clean_amount.replace('.', '').replace(',', '.')
+            else:
+                clean_amount = clean_amount.replace(',', '')
+
+        amount = round(float(clean_amount), 2)
+    except ValueError as e:
+        if str(e) == "Monto no puede estar vacío":
+            raise
+        raise ValueError(f"Formato de monto inválido: {str(e)}")
+
+    if amount <= 0:
+        raise ValueError("El monto debe ser positivo")
+    return amount
+
+
+def normalize_amounts(values: pd.Series) -> tuple:
+    """Versión vectorizada de `normalize_amount`: devuelve (montos, errores por fila)"""
+    import pandas as pd
+    clean = values.fillna('').astype(str).str.strip().str.replace(r'[^\d.,]', '', regex=True)
+    empty = clean == ''
+
+    has_comma = clean.str.contains(',', regex=False)
+    decimal_comma = has_comma & (clean.str.rsplit(',', n=1).str[-1].str.len() == 2)
+    clean = clean.where(~decimal_comma, clean.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    clean = clean.where(~(has_comma & ~decimal_comma), clean.str.replace(',', '', regex=False))
+
+    # float() rechaza números con más de un punto; to_numeric no siempre
+    malformed = clean.str.count(r'\.') > 1
+    amounts = pd.to_numeric(clean.where(~malformed), errors='coerce').round(2)
+
+    errors = pd.Series(None, index=values.index, dtype=object)
+    errors[amounts <= 0] = "El monto debe ser positivo"
+    errors[amounts.isna()] = "Formato de monto inválido"
+    errors[empty] = "Monto no puede estar vacío"
+    return amounts, errors
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """Fechas ISO 8601 como datetime sin zona horaria, igual que las guardadas (hora local).
+
+    Las que traen zona ("Z", "+03:00") se convierten a la hora local; las que
+    no, se toman tal cual. Las inválidas quedan como NaT.
+    """
+    import pandas as pd
+    from dateutil.tz import tzlocal
+    text = values.astype('string').str.strip()
+    aware = text.str.contains(r'\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:Z|[+-]\d{2}(?::?\d{2})?)$', regex=True).fillna(False).astype(bool)
+    # Por separado: en un mismo parseo pandas aplica a una fecha sin zona la zona de la anterior
+    naive = pd.to_datetime(text.where(~aware), errors='coerce', format='ISO8601')
+    local = pd.to_datetime(text.where(aware), errors='coerce', format='ISO8601', utc=True) \
+        .dt.tz_convert(tzlocal()).dt.tz_localize(None)
+    return naive.where(~aware, local)
+
+
+def iter_csv_records(stream, encoding: str = 'utf-8-sig') -> Iterator[Dict]:
+    """Lee un CSV fila por fila desde un stream binario"""
+    reader = codecs.getreader(encoding)(stream)
+    for row in csv.DictReader(reader):
+        yield {(key or '').strip().lower(): value for key, value in row.items()}
+
+
+def iter_ndjson_records(stream, encoding: str = 'utf-8') -> Iterator[Dict]:
+    """Lee NDJSON (un objeto JSON por línea) desde un stream binario"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line.decode(encoding))
+        except (ValueError, UnicodeDecodeError) as e:
+            record = {'_error': f"JSON inválido: {str(e)}"}
+        yield record if isinstance(record, dict) else {'_error': "Se esperaba un objeto JSON"}
+
+
+def _chunks(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkIngestor:
+    """Importa transacciones de un usuario en lotes de tamaño fijo.
+
+    Cada lote se valida con las mismas reglas que `add_transaction` de forma
+    vectorizada, se deduplica (contra el archivo y contra la base), se
+    puntúa con una sola llamada al modelo y se inserta con executemany.
+    Solo se mantiene en memoria un lote: las repetidas de lotes anteriores ya
+    están en la base y se detectan allí. La respuesta detalla las primeras
+    BULK_MAX_ROW_RESULTS filas y cuenta el resto en el resumen.
+    """
+
+    def __init__(self, db_session, user_id: int, chunk_size: int = BULK_CHUNK_SIZE, detector=None):
+        self.db_session = db_session
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.detector = detector or FraudDetector()
+        self.results = []
+        self.inserted_ids = []
+        self.summary = {'total': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0, 'flagged': 0,
+                        'rows_omitted': 0}
+
+    def ingest(self, records: Iterable[Dict]) -> dict:
+        row_number = 0
+        for chunk in _chunks(records, self.chunk_size):
+            self._ingest_chunk(chunk, row_number)
+            row_number += len(chunk)
+        return {'summary': self.summary, 'rows': self.results}
+
+    def _ingest_chunk(self, records: List[Dict], offset: int) -> None:
+        import numpy as np
+        import pandas as pd
+        df = pd.DataFrame.from_records(records)
+        df.index = np.arange(offset + 1, offset + len(records) + 1)  # número de fila (1 = primera fila de datos)
+        for column in ('amount', 'method', 'payment_method', 'date', '_error'):
+            if column not in df.columns:
+                df[column] = None
+
+        amounts, errors = normalize_amounts(df['amount'])
+        methods = df['method'].where(df['method'].notna(), df['payment_method'])
+        errors[~methods.isin(VALID_METHODS) & errors.isna()] = \
+            f"Método de pago inválido. Use: {', '.join(VALID_METHODS)}"
+
+        now = datetime.now()
+        # Una fecha vacía en el CSV equivale a no indicarla
+        dated = df['date'].notna() & (df['date'].astype(str).str.strip() != '')
+        dates = parse_dates(df['date'].where(dated))
+        errors[dated & dates.isna() & errors.isna()] = "Formato de fecha inválido. Use YYYY-MM-DD HH:MM:SS"
+        dates = dates.fillna(pd.Timestamp(now))
+        errors[df['_error'].notna()] = df['_error']
+
+        valid = df.index[errors.isna()]
+        chunk = pd.DataFrame({
+            'amount': amounts[valid].astype(float),
+            'payment_method': methods[valid],
+            'date': dates[valid],
+            'dated': dated[valid],
+        })
+        duplicate_rows = self._find_duplicates(chunk)
+
+        rows = chunk.drop(index=duplicate_rows)
+        ids = self._insert(rows) if len(rows) else []
+
+        results = {row: {'row': int(row), 'status': 'invalid', 'error': errors[row]} for row in df.index[errors.notna()]}
+        for row in duplicate_rows:
+            results[row] = {'row': int(row), 'status': 'duplicate'}
+        for row, tx_id in zip(rows.index, ids):
+            results[row] = {'row': int(row), 'status': 'inserted', 'id': tx_id}
+        room = max(BULK_MAX_ROW_RESULTS - len(self.results), 0)
+        self.results.extend(results[row] for row in df.index[:room])
+        self.summary['rows_omitted'] += max(len(df) - room, 0)
+
+        self.summary['total'] += len(df)
+        self.summary['invalid'] += int(errors.notna().sum())
+        self.summary['duplicates'] += len(duplicate_rows)
+        self.summary['inserted'] += len(ids)
+
+    def _find_duplicates(self, chunk: pd.DataFrame) -> list:
+        """Filas similares a otra anterior del archivo o ya registrada en la base.
+
+        Misma regla que `add_transaction` (core.duplicates.is_similar): mismo
+        método, monto a menos de DUPLICATE_AMOUNT_TOLERANCE y fechas a no más de
+        DUPLICATE_WINDOW_SECONDS. La base se consulta solo alrededor de las
+        fechas del lote; las filas de lotes anteriores ya están guardadas.
+        """
+        # Las filas sin fecha reciben la hora de carga: no se comparan por fecha
+        dated = chunk[chunk['dated']]
+        if dated.empty:
+            return []
+        dates = [date.to_pydatetime() for date in dated['date']]
+        window = timedelta(seconds=DUPLICATE_WINDOW_SECONDS)
+
+        # Por método, fechas ordenadas y sus montos: de la base y de las filas ya aceptadas
+        candidates = {}
+
+        def add(date, amount, method):
+            dates_, amounts = candidates.setdefault(method, ([], []))
+            position = bisect.bisect_right(dates_, date)
+            dates_.insert(position, date)
+            amounts.insert(position, amount)
+
+        intervals = duplicate_windows(dates)
+        for i in range(0, len(intervals), DUPLICATE_LOOKUP_BATCH):
+            for date, amount, method in nearby_transactions_query(
+                    self.db_session, self.user_id, intervals[i:i + DUPLICATE_LOOKUP_BATCH]):
+                add(date, amount, method)
+
+        duplicates = []
+        for row, amount, method, date in zip(dated.index, dated['amount'], dated['payment_method'], dates):
+            dates_, amounts = candidates.get(method, ([], []))
+            start = bisect.bisect_left(dates_, date - window)
+            end = bisect.bisect_right(dates_, date + window)
+            if any(is_similar(amount, method, other, method) for other in amounts[start:end]):
+                duplicates.append(row)
+            else:
+                add(date, amount, method)
+        return duplicates
+
+    def _insert(self, rows: pd.DataFrame) -> list:
+        """Puntúa el lote con una sola llamada al modelo y lo inserta en una transacción"""
+        values = [{
+            'user_id': self.user_id,
+            'amount': amount,
+            'payment_method': method,
+            'date': date.to_pydatetime(),
+        } for amount, method, date in zip(rows['amount'], rows['payment_method'], rows['date'])]
+
+        try:
+            # Los agregados del usuario se actualizan en la misma transacción que el insert
+            user_features.observe_rows(self.db_session, self.user_id, values)
+            scores, version = self.detector.score_with_version(values)
+            scored_at = datetime.now()
+            for i, value in enumerate(values):
+                value['is_flagged'] = bool(scores is not None and scores[i] < 0)
+                value['fraud_score'] = float(scores[i]) if scores is not None else None
+                value['model_version'] = version if scores is not None else None
+                value['scored_at'] = scored_at if scores is not None else None
+            rollups.record_inserts(self.db_session, values)
+
+            ids = list(self.db_session.scalars(
+                insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True), values
+            ))
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+
+        self.inserted_ids.extend(ids)
+        self.summary['flagged'] += sum(1 for value in values if value['is_flagged'])
+        return ids
@@ -0,0 +1,75 @@
+from typing import Iterator, Optional, Sequence
+import numpy as np
+import pandas as pd
+from core.database import Session
+from core.models import BEHAVIOR_FEATURES, VALID_METHODS
+from core.queries import transaction_columns_query
+
+LOAD_CHUNK_SIZE = 50000  # filas por bloque leído de la base
+
+PAYMENT_METHOD_DTYPE = pd.CategoricalDtype(VALID_METHODS)
+
+# Tipos compactos por columna: 22 bytes por fila con id, user_id, amount, date,
+# payment_method e is_flagged (contra cientos de bytes por fila con entidades del ORM)
+COLUMN_DTYPES = {
+    'id': np.int32,
+    'user_id': np.int32,
+    'amount': np.float32,  # para análisis; el entrenamiento y core.features piden float64
+    'date': 'datetime64[us]',
+    'payment_method': PAYMENT_METHOD_DTYPE,
+    'is_flagged': bool,
+    'fraud_score': np.float32,
+    **{name: np.float32 for name in BEHAVIOR_FEATURES},
+}
+
+# Columnas que pueden ser NULL (se leen como NaN)
+NULLABLE_COLUMNS = {'fraud_score', *BEHAVIOR_FEATURES}
+
+DEFAULT_COLUMNS = ('id', 'amount', 'date', 'is_flagged')
+
+
+def _to_array(name: str, values: tuple, dtype):
+    if name == 'payment_method':
+        return pd.Categorical(values, dtype=dtype)
+    if name == 'is_flagged':
+        return np.fromiter((bool(v) for v in values), dtype=bool, count=len(values))
+    if name in NULLABLE_COLUMNS:
+        return np.array([np.nan if v is None else v for v in values], dtype=dtype)
+    return np.array(values, dtype=dtype)
+
+
+def iter_transaction_chunks(db_session=None, columns: Sequence[str] = DEFAULT_COLUMNS,
+                            chunk_size: int = LOAD_CHUNK_SIZE, after_id: int = 0,
+                            user_id: Optional[int] = None, dtypes: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+    """Recorre la tabla de transacciones en bloques de `chunk_size` filas ordenadas por id.
+
+    Solo se seleccionan `columns` y cada bloque se convierte directamente a
+    arrays con los tipos de `COLUMN_DTYPES` (o los de `dtypes` para las columnas
+    que lo necesiten), sin crear entidades del ORM.
+    """
+    unknown = set(columns) - set(COLUMN_DTYPES)
+    if unknown:
+        raise ValueError(f"Columnas no soportadas: {', '.join(sorted(unknown))}")
+
+    own_session = db_session is None
+    db_session = db_session or Session()
+    try:
+        query = transaction_columns_query(db_session, columns, after_id, user_id)
+        stmt = query.statement.execution_options(yield_per=chunk_size)
+        column_dtypes = {**COLUMN_DTYPES, **(dtypes or {})}
+        for rows in db_session.execute(stmt).partitions():
+            values = list(zip(*rows))
+            yield pd.DataFrame({name: _to_array(name, values[i], column_dtypes[name])
+                                for i, name in enumerate(columns)})
+    finally:
+        if own_session:
+            db_session.close()
+
+
+def load_transactions_frame(db_session=None, columns: Sequence[str] = DEFAULT_COLUMNS,
+                            chunk_size: int = LOAD_CHUNK_SIZE, **filters) -> pd.DataFrame:
+    """Carga las columnas pedidas en un solo DataFrame con tipos compactos"""
+    chunks = list(iter_transaction_chunks(db_session, columns, chunk_size, **filters))
+    if not chunks:
+        return pd.DataFrame({name: pd.Series(dtype=COLUMN_DTYPES[name]) for name in columns})
+    return pd.concat(chunks, ignore_index=True)
@@ -1,7 +1,16 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Boolean, Index, JSON
 from sqlalchemy.orm import relationship
 from core.database import Base
 
+VALID_METHODS = ["Tarjeta Crédito", "Tarjeta Débito", "Transferencia", "Efectivo"]
+
+# Historial del usuario antes de cada transacción, calculado por core.features
+BEHAVIOR_FEATURES = [
+    'user_count_1h', 'user_sum_1h', 'user_mean_1h', 'user_std_1h',
+    'user_count_24h', 'user_sum_24h', 'user_mean_24h', 'user_std_24h',
+    'user_count_30d', 'user_sum_30d', 'user_mean_30d', 'user_std_30d',
+    'user_method_freq_30d', 'user_seconds_since_last',
+]
 
 class User(Base):
     __tablename__ = 'users'
@@ -17,6 +26,13 @@ class User(Base):
 
 class Transaction(Base):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Listado paginado, reportes y transacciones recientes (SQLite agrega el id al final)
+        Index('ix_transactions_user_date', 'user_id', 'date'),
+        # Verificación de duplicados en add_transaction
+        Index('ix_transactions_user_method_date', 'user_id', 'payment_method', 'date', 'amount'),
+    )
+
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete='RESTRICT'), nullable=False)
     amount = Column(Float)
@@ -24,8 +40,65 @@ class Transaction(Base):
     payment_method = Column(String(50))
     is_flagged = Column(Boolean, default=False)
 
+    # Resultado del modelo calculado al registrar la transacción
+    fraud_score = Column(Float)
+    model_version = Column(String(40))
+    scored_at = Column(DateTime)
+
+    # Features de comportamiento (BEHAVIOR_FEATURES) en el momento de registrarla
+    user_count_1h = Column(Float)
+    user_sum_1h = Column(Float)
+    user_mean_1h = Column(Float)
+    user_std_1h = Column(Float)
+    user_count_24h = Column(Float)
+    user_sum_24h = Column(Float)
+    user_mean_24h = Column(Float)
+    user_std_24h = Column(Float)
+    user_count_30d = Column(Float)
+    user_sum_30d = Column(Float)
+    user_mean_30d = Column(Float)
+    user_std_30d = Column(Float)
+    user_method_freq_30d = Column(Float)
+    user_seconds_since_last = Column(Float)
+
     # Relación con usuario
     user = relationship("User", back_populates="transactions")
 
     def __repr__(self):
         return f"Transacción ID: {self.id}, Monto: ${self.amount}, Fecha: {self.date.strftime('%Y-%m-%d %H:%M:%S')}"
+
+
+class UserFeatureState(Base):
+    """Agregados de comportamiento de un usuario, actualizados con cada transacción"""
+    __tablename__ = 'user_feature_state'
+
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    last_date = Column(DateTime)
+
+    # Conteo, suma y suma de cuadrados con decaimiento exponencial por ventana
+    count_1h = Column(Float, default=0.0)
+    sum_1h = Column(Float, default=0.0)
+    sumsq_1h = Column(Float, default=0.0)
+    count_24h = Column(Float, default=0.0)
+    sum_24h = Column(Float, default=0.0)
+    sumsq_24h = Column(Float, default=0.0)
+    count_30d = Column(Float, default=0.0)
+    sum_30d = Column(Float, default=0.0)
+    sumsq_30d = Column(Float, default=0.0)
+
+    # Conteo con decaimiento de 30 días por método de pago
+    method_counts = Column(JSON, default=dict)
+
+
+class DailyUserStats(Base):
+    """Resumen diario por usuario y método de pago, mantenido por core.rollups"""
+    __tablename__ = 'daily_user_stats'
+
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    payment_method = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    min_amount = Column(Float)
+    max_amount = Column(Float)
+    flagged = Column(Integer, nullable=False, default=0)
@@ -1,65 +1,319 @@
+import os
 import threading
 import time
-from core.fraud_detection import FraudDetector
+from datetime import datetime
+from sqlalchemy import update
+from core import rollups
+from core.background import RUN_DIR
+from core.features import user_features
+from core.fraud_detection import FraudDetector, model_registry
 from core.database import Session
 from core.models import Transaction
-from utils.alert_system import AlertSystem
+from core.queries import new_transactions_query, stale_scores_query, transactions_by_ids_query
+from core.events import transaction_events
+from utils.alert_system import alert_dispatcher
+
+# Con varios workers solo el líder recibe eventos propios: lo registrado en los
+# demás procesos llega por la pasada de recuperación (gunicorn.conf.py la acorta)
+CATCH_UP_SECONDS = float(os.environ.get('MONITOR_CATCH_UP_SECONDS', 60))
+MONITOR_WATERMARK_PATH = os.path.join(RUN_DIR, 'monitor.watermark')  # último id revisado por la recuperación
 
 
 class TransactionMonitor:
-    def __init__(self, check_interval=60):
-        self.check_interval = check_interval  # segundos
+    """Procesa las transacciones nuevas publicadas en el bus de eventos.
+
+    Un hilo trabajador vacía la cola en micro-lotes: puntúa con una sola
+    llamada al modelo las que no se evaluaron al registrarse, guarda las marcas
+    en una sola transacción y luego envía alertas y notifica al callback. La
+    consulta por `id > último revisado` queda solo como recuperación de
+    eventos perdidos (cola llena, otros procesos, reinicios).
+
+    El último id revisado se guarda en `watermark_path` tras cada pasada: al
+    arrancar, la primera pasada retoma desde ahí lo registrado mientras el
+    monitor o el líder no corrían. Lo procesado por el bus después de la última
+    marca puede volver a alertarse tras una caída (entrega al menos una vez).
+    """
+
+    def __init__(self, check_interval=CATCH_UP_SECONDS, batch_size=500, event_bus=None, alerts=None,
+                 watermark_path=MONITOR_WATERMARK_PATH):
+        self.check_interval = check_interval  # segundos entre pasadas de recuperación
+        self.watermark_path = watermark_path
+        self.batch_size = batch_size
+        self.event_bus = event_bus or transaction_events
+        self.alerts = alerts or alert_dispatcher
         self.detector = FraudDetector()
         self.running = False
         self.callback = None  # NUEVO
+        self._thread = None
+        self._last_checked_id = 0
+        self._processed_ids = set()  # procesados por el bus desde la última recuperación
+        self._stats_lock = threading.Lock()
+        self.processed = 0
+        self.batches = 0
+        self.flagged = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_batch_at = None
 
     def start_monitoring(self, callback=None):  # MODIFICADO
         """Inicia el monitoreo en segundo plano"""
+        if callback is not None:
+            self.callback = callback  # NUEVO
+        if self.running:
+            return
         self.running = True
-        self.callback = callback  # NUEVO
-        monitor_thread = threading.Thread(target=self._monitor_loop)
-        monitor_thread.daemon = True
-        monitor_thread.start()
+        self._thread = threading.Thread(target=self._monitor_loop)
+        self._thread.daemon = True
+        self._thread.start()
 
     def stop_monitoring(self):
         """Detiene el monitoreo"""
         self.running = False
 
+    def metrics(self) -> dict:
+        """Estado del monitor: profundidad de la cola, retraso y contadores"""
+        with self._stats_lock:
+            stats = {
+                'running': self.running,
+                'processed': self.processed,
+                'batches': self.batches,
+                'flagged': self.flagged,
+                'last_lag_seconds': round(self.last_lag, 4),
+                'max_lag_seconds': round(self.max_lag, 4),
+                'last_batch_at': self.last_batch_at.isoformat() if self.last_batch_at else None,
+                'last_checked_id': self._last_checked_id
+            }
+        stats.update(self.event_bus.metrics())
+        stats['alerts'] = self.alerts.metrics()
+        return stats
+
     def _monitor_loop(self):
         """Bucle principal de monitoreo"""
         session = Session()
-        last_checked_id = self._get_last_transaction_id(session)
+        try:
+            self._last_checked_id = self._load_watermark(session)
+        finally:
+            session.close()
+        next_catch_up = time.monotonic()  # lo registrado mientras no corría se revisa enseguida
 
         while self.running:
             try:
-                # Obtener nuevas transacciones
-                new_transactions = session.query(Transaction).filter(
-                    Transaction.id > last_checked_id
-                ).all()
-
-                for tx in new_transactions:
-                    # Verificar fraude
-                    tx_data = {
-                        'amount': tx.amount,
-                        'date': tx.date
-                    }
-                    if self.detector.detect_fraud(tx_data):
-                        tx.is_flagged = True
-                        AlertSystem.send_alert(tx)  # Enviar alerta
-                        session.commit()
-
-                    # NUEVO: enviar al callback
-                    if self.callback:
-                        self.callback(tx)
-
-                    last_checked_id = max(last_checked_id, tx.id)
+                events = self.event_bus.drain(self.batch_size, timeout=1.0)
+                if events:
+                    self.process_batch([tx_id for tx_id, _ in events])
+                    self._record_lag(events)
+
+                if time.monotonic() >= next_catch_up:
+                    self._catch_up()
+                    next_catch_up = time.monotonic() + self.check_interval
 
             except Exception as e:
                 print(f"Error en monitoreo: {e}")
+                time.sleep(1)
+
+        # Al detenerse: procesar lo pendiente para que la marca guardada quede al día
+        try:
+            self._catch_up()
+        except Exception as e:
+            print(f"Error en monitoreo: {e}")
+
+    def process_batch(self, tx_ids):
+        """Puntúa, guarda y notifica un lote de transacciones"""
+        session = Session(expire_on_commit=False)
+        try:
+            transactions = transactions_by_ids_query(session, tx_ids).all()
+            self._process(session, transactions)
+            self._processed_ids.update(tx.id for tx in transactions)
+        finally:
+            session.close()
+
+    def _catch_up(self):
+        """Procesa las transacciones nuevas que no llegaron por el bus"""
+        session = Session(expire_on_commit=False)
+        try:
+            last_checked_id = self._last_checked_id
+            while True:
+                transactions = new_transactions_query(session, last_checked_id) \
+                    .order_by(Transaction.id).limit(self.batch_size).all()
+                if not transactions:
+                    break
+                last_checked_id = transactions[-1].id
+                self._process(session, [tx for tx in transactions if tx.id not in self._processed_ids])
+
+            self._processed_ids = {tx_id for tx_id in self._processed_ids if tx_id > last_checked_id}
+            self._last_checked_id = last_checked_id
+            self._save_watermark()
+        finally:
+            session.close()
+
+    def _process(self, session, transactions):
+        if not transactions:
+            return
+
+        # Insertadas por fuera de la API: calcular sus features de comportamiento
+        without_features = [tx for tx in transactions if tx.user_count_30d is None]
+        if without_features:
+            user_features.observe(session, without_features)
+
+        # Puntuar en un solo lote las que no se evaluaron al registrarse y guardar todo junto
+        observed = {id(tx) for tx in without_features}
+        pending = [tx for tx in transactions if tx.model_version is None or id(tx) in observed]
+        # Las ya observadas están en el resumen diario: solo cuenta si cambia su marca
+        previous_flags = [(tx, bool(tx.is_flagged)) for tx in pending if id(tx) not in observed]
+        if pending:
+            self.detector.score_transactions(pending)
+        if without_features:
+            rollups.record_inserts(session, without_features)
+        rollups.record_flag_changes(session, [
+            (tx.user_id, tx.date, tx.payment_method, 1 if tx.is_flagged else -1)
+            for tx, was_flagged in previous_flags if bool(tx.is_flagged) != was_flagged
+        ])
+        if without_features or pending:
+            session.commit()
+
+        flagged = 0
+        for tx in transactions:
+            if tx.is_flagged:
+                flagged += 1
+                self._send_alert(tx)
+
+            # NUEVO: enviar al callback
+            if self.callback:
+                try:
+                    self.callback(tx)
+                except Exception as e:
+                    print(f"Error en callback de monitoreo: {e}")
+
+        with self._stats_lock:
+            self.processed += len(transactions)
+            self.batches += 1
+            self.flagged += flagged
+            self.last_batch_at = datetime.now()
+
+    def _send_alert(self, tx):
+        """Encola la alerta: el envío por correo ocurre en el hilo del despachador"""
+        score = tx.fraud_score if tx.fraud_score is not None else 0.0
+        reasons = [f"Puntaje de anomalía {score:.3f} (modelo {tx.model_version})"]
+        if tx.user_std_30d:
+            zscore = (tx.amount - tx.user_mean_30d) / tx.user_std_30d
+            reasons.append(f"Monto a {zscore:.1f} desviaciones del promedio de 30 días del usuario")
+        try:
+            self.alerts.submit({
+                'id': tx.id,
+                'user_id': tx.user_id,
+                'amount': float(tx.amount),
+                'date': tx.date,
+                'payment_method': tx.payment_method
+            }, {
+                # 0 es el umbral del modelo: 50% ahí, 100% con puntaje -0.5 o menor
+                'confidence': min(max(0.5 - score, 0.0), 1.0),
+                'reasons': reasons
+            })
+        except Exception as e:
+            print(f"Error encolando alerta: {e}")
+
+    def _record_lag(self, events):
+        now = time.monotonic()
+        lag = max(now - published_at for _, published_at in events)
+        with self._stats_lock:
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def _load_watermark(self, session) -> int:
+        """Último id revisado según la marca guardada; sin marca, la última transacción"""
+        last_id = self._get_last_transaction_id(session)
+        try:
+            with open(self.watermark_path) as f:
+                return min(int(f.read()), last_id)  # una marca mayor es de una base anterior
+        except (FileNotFoundError, ValueError):
+            return last_id
 
-            time.sleep(self.check_interval)
+    def _save_watermark(self) -> None:
+        os.makedirs(os.path.dirname(self.watermark_path), exist_ok=True)
+        tmp_path = f"{self.watermark_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(self._last_checked_id))
+        os.replace(tmp_path, self.watermark_path)
 
     def _get_last_transaction_id(self, session):
         """Obtiene el ID de la última transacción"""
         last_tx = session.query(Transaction).order_by(Transaction.id.desc()).first()
         return last_tx.id if last_tx else 0
+
+
+class ScoreBackfillJob:
+    """Recalcula en segundo plano los puntajes guardados con otra versión del modelo"""
+
+    def __init__(self, batch_size=1000, check_interval=300):
+        self.batch_size = batch_size
+        self.check_interval = check_interval  # segundos
+        self.detector = FraudDetector()
+        self.running = False
+        self._wake = threading.Event()
+        model_registry.add_listener(lambda scoring_model: self._wake.set())
+
+    def start(self):
+        """Inicia el proceso de relleno en segundo plano"""
+        if self.running:
+            return
+        self.running = True
+        backfill_thread = threading.Thread(target=self._loop)
+        backfill_thread.daemon = True
+        backfill_thread.start()
+
+    def stop(self):
+        """Detiene el proceso de relleno"""
+        self.running = False
+        self._wake.set()
+
+    def _loop(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error recalculando puntajes: {e}")
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def run_once(self):
+        """Puntúa por lotes las transacciones sin puntaje o con una versión vieja del modelo"""
+        scoring_model = model_registry.get()
+        if scoring_model is None:
+            return 0
+
+        version = scoring_model.version
+        session = Session()
+        last_id = 0
+        total = 0
+        try:
+            while True:
+                rows = stale_scores_query(session, last_id, version, self.batch_size).all()
+                if not rows:
+                    break
+
+                scores, version = self.detector.score_with_version([r._asdict() for r in rows])
+                if scores is None:
+                    break
+
+                scored_at = datetime.now()
+                session.execute(update(Transaction), [{
+                    'id': r.id,
+                    'fraud_score': float(score),
+                    'model_version': version,
+                    'is_flagged': bool(score < 0),
+                    'scored_at': scored_at
+                } for r, score in zip(rows, scores)])
+                rollups.record_flag_changes(session, [
+                    (r.user_id, r.date, r.payment_method, 1 if score < 0 else -1)
+                    for r, score in zip(rows, scores) if bool(score < 0) != bool(r.is_flagged)
+                ])
+                session.commit()
+
+                total += len(rows)
+                last_id = rows[-1].id
+            return total
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
@@ -0,0 +1,85 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_
+from core.models import Transaction, VALID_METHODS
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(tx: Transaction) -> str:
+    """Genera el token que apunta a la transacción siguiente a `tx`"""
+    payload = json.dumps([tx.date.isoformat(), tx.id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token: str) -> tuple:
+    """Devuelve (fecha, id) a partir de un token de paginación"""
+    try:
+        date_str, tx_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return datetime.fromisoformat(date_str), int(tx_id)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"Cursor inválido: {str(e)}")
+
+
+def parse_page_args(args) -> dict:
+    """Valida los parámetros de paginación y filtros recibidos en la URL"""
+    try:
+        page_size = int(args.get('page_size', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("page_size debe ser un número entero")
+    if page_size < 1:
+        raise ValueError("page_size debe ser positivo")
+
+    filters = {
+        'page_size': min(page_size, MAX_PAGE_SIZE),
+        'cursor': decode_cursor(args['cursor']) if args.get('cursor') else None,
+        'start_date': None,
+        'end_date': None,
+        'method': args.get('method') or None,
+        'flagged_only': str(args.get('flagged', '')).lower() in ('1', 'true', 'on', 'yes'),
+    }
+
+    for key in ('start_date', 'end_date'):
+        if args.get(key):
+            try:
+                filters[key] = datetime.strptime(args[key], '%Y-%m-%d')
+            except ValueError:
+                raise ValueError("Formato de fecha inválido. Use YYYY-MM-DD")
+
+    if filters['method'] and filters['method'] not in VALID_METHODS:
+        raise ValueError(f"Método de pago inválido. Use: {', '.join(VALID_METHODS)}")
+
+    return filters
+
+
+def transactions_page_query(db_session, user_id, page_size=DEFAULT_PAGE_SIZE, cursor=None,
+                            start_date=None, end_date=None, method=None, flagged_only=False):
+    """Consulta de una página (más una fila para saber si hay siguiente)"""
+    query = db_session.query(Transaction).filter(Transaction.user_id == user_id)
+
+    if start_date:
+        query = query.filter(Transaction.date >= start_date)
+    if end_date:
+        query = query.filter(Transaction.date < end_date + timedelta(days=1))
+    if method:
+        query = query.filter(Transaction.payment_method == method)
+    if flagged_only:
+        query = query.filter(Transaction.is_flagged.is_(True))
+    if cursor:
+        query = query.filter(tuple_(Transaction.date, Transaction.id) < tuple(cursor))
+
+    return query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(page_size + 1)
+
+
+def paginate_transactions(db_session, user_id, page_size=DEFAULT_PAGE_SIZE, **filters) -> tuple:
+    """Devuelve (transacciones, cursor siguiente) ordenadas por fecha descendente.
+
+    Usa paginación por clave (date, id): cada página es un rango del índice
+    sin OFFSET, así que el costo no crece con el historial del usuario.
+    """
+    rows = transactions_page_query(db_session, user_id, page_size, **filters).all()
+
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
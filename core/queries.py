@@ -0,0 +1,148 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, or_
+from core.models import BEHAVIOR_FEATURES, DailyUserStats, Transaction
+
+# Consultas frecuentes sobre `transactions`. Se definen aquí para que cada
+# ruta use exactamente la misma forma de consulta que audita
+# benchmarks/query_plans.py contra los índices declarados en core/models.py.
+
+
+def report_day_range(start_date, end_date) -> tuple:
+    """Convierte un rango de días ('YYYY-MM-DD' o date) en [inicio, fin) con el último día completo"""
+    def as_date(value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+    start = datetime.combine(as_date(start_date), datetime.min.time())
+    end = datetime.combine(as_date(end_date), datetime.min.time()) + timedelta(days=1)
+    return start, end
+
+
+def recent_transactions_query(db_session, user_id, limit=5):
+    """Últimas transacciones de un usuario (panel de monitoreo)"""
+    return db_session.query(Transaction) \
+        .filter(Transaction.user_id == user_id) \
+        .order_by(Transaction.date.desc()) \
+        .limit(limit)
+
+
+def duplicate_transaction_query(db_session, user_id, amount, method, since, tolerance):
+    """Transacción similar del mismo usuario y método registrada desde `since`.
+
+    El monto se compara como rango y no con abs(), para que el filtro se
+    resuelva dentro de ix_transactions_user_method_date.
+    """
+    return db_session.query(Transaction).filter(
+        Transaction.user_id == user_id,
+        Transaction.payment_method == method,
+        Transaction.date >= since,
+        Transaction.amount > amount - tolerance,
+        Transaction.amount < amount + tolerance
+    )
+
+
+def nearby_transactions_query(db_session, user_id, intervals):
+    """(fecha, monto, método) de las transacciones del usuario dentro de alguno de los
+    intervalos (inicio, fin): una búsqueda acotada por intervalo, unidas con UNION ALL"""
+    queries = [
+        db_session.query(Transaction.date, Transaction.amount, Transaction.payment_method).filter(
+            Transaction.user_id == user_id,
+            Transaction.date >= start,
+            Transaction.date <= end
+        ) for start, end in intervals
+    ]
+    return queries[0].union_all(*queries[1:]) if len(queries) > 1 else queries[0]
+
+
+def report_transactions_query(db_session, user_id, start_date, end_date, columns=None):
+    """Transacciones de un usuario dentro de un rango de fechas (reportes).
+
+    Con `columns` se seleccionan solo esas columnas en lugar de entidades completas.
+    """
+    entities = [getattr(Transaction, name) for name in columns] if columns else [Transaction]
+    start, end = report_day_range(start_date, end_date)
+    return db_session.query(*entities).filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= start,
+        Transaction.date < end
+    ).order_by(Transaction.date.desc())
+
+
+def report_summary_query(db_session, user_id, start_date, end_date, group_by=None):
+    """Agregados (cantidad, total, promedio, mínimo, máximo, sospechosas) del rango de un reporte.
+
+    Se leen de `daily_user_stats` (una fila por día y método), no de `transactions`.
+    `group_by` puede ser 'method' o 'day'; sin él se devuelve una sola fila.
+    """
+    keys = []
+    if group_by == 'method':
+        keys = [DailyUserStats.payment_method]
+    elif group_by == 'day':
+        keys = [DailyUserStats.day]
+
+    start, end = report_day_range(start_date, end_date)
+    count = func.coalesce(func.sum(DailyUserStats.count), 0)
+    total = func.coalesce(func.sum(DailyUserStats.total), 0.0)
+    query = db_session.query(
+        *keys,
+        count.label('count'),
+        total.label('total'),
+        (total / func.nullif(count, 0)).label('average'),
+        func.min(DailyUserStats.min_amount).label('minimum'),
+        func.max(DailyUserStats.max_amount).label('maximum'),
+        func.coalesce(func.sum(DailyUserStats.flagged), 0).label('flagged')
+    ).filter(
+        DailyUserStats.user_id == user_id,
+        DailyUserStats.day >= start.date(),
+        DailyUserStats.day < end.date()
+    )
+    if keys:
+        query = query.group_by(*keys).order_by(*keys)
+    return query
+
+
+def report_watermark_query(db_session, user_id, start_date, end_date):
+    """Huella de los datos de un reporte: cambia si se agregan, borran, marcan o repuntúan filas del rango"""
+    start, end = report_day_range(start_date, end_date)
+    return db_session.query(
+        func.count(Transaction.id),
+        func.max(Transaction.id),
+        func.coalesce(func.sum(Transaction.is_flagged), 0),
+        func.max(Transaction.scored_at)
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= start,
+        Transaction.date < end
+    )
+
+
+def new_transactions_query(db_session, last_id):
+    """Transacciones registradas después de `last_id` (monitor)"""
+    return db_session.query(Transaction).filter(Transaction.id > last_id)
+
+
+def transactions_by_ids_query(db_session, tx_ids):
+    """Transacciones por clave primaria (lotes del bus de eventos)"""
+    return db_session.query(Transaction).filter(Transaction.id.in_(tx_ids)).order_by(Transaction.id)
+
+
+def stale_scores_query(db_session, last_id, version, limit):
+    """Transacciones sin puntaje o puntuadas con otra versión del modelo"""
+    behavior = [getattr(Transaction, name) for name in BEHAVIOR_FEATURES]
+    return db_session.query(Transaction.id, Transaction.user_id, Transaction.amount, Transaction.date,
+                            Transaction.payment_method, Transaction.is_flagged, *behavior).filter(
+        Transaction.id > last_id,
+        or_(Transaction.model_version.is_(None), Transaction.model_version != version)
+    ).order_by(Transaction.id).limit(limit)
+
+
+def transaction_columns_query(db_session, columns, after_id=0, user_id=None):
+    """Solo las columnas pedidas, de las filas posteriores a `after_id`, en orden de id"""
+    query = db_session.query(*(getattr(Transaction, name) for name in columns)) \
+        .filter(Transaction.id > after_id)
+    if user_id is not None:
+        query = query.filter(Transaction.user_id == user_id)
+    return query.order_by(Transaction.id)
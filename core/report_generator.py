@@ -1,9 +1,31 @@
 import os
+import io
+import math
+import uuid
+import zlib
 from datetime import datetime
 import csv
-from fpdf import FPDF
 from core.database import Session
-from core.models import Transaction
+from core.queries import report_summary_query, report_transactions_query
+
+CSV_COLUMNS = ['id', 'date', 'amount', 'payment_method']
+REPORT_CHUNK_SIZE = 5000  # filas leídas del cursor y escritas por bloque
+PDF_MAX_ROWS = int(os.environ.get('PDF_MAX_ROWS', 1000))  # filas de detalle en el PDF; el resumen cubre todas
+PDF_HISTOGRAM_BARS = 60
+
+
+def gzip_stream(chunks, level: int = 6):
+    """Comprime al vuelo una secuencia de bloques de texto (formato gzip)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = cabecera gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _money(value):
+    return f"${value:,.2f}"
 
 
 class ReportGenerator:
@@ -12,61 +34,149 @@ class ReportGenerator:
         if not os.path.exists(self.reports_dir):
             os.makedirs(self.reports_dir)
 
-    def generate_pdf_report(self, user_id, start_date, end_date):
-        # Obtener transacciones
-        transactions = self._get_transactions(user_id, start_date, end_date)
+    def generate_pdf_report(self, user_id, start_date, end_date, max_rows=PDF_MAX_ROWS, filepath=None,
+                            progress=None):
+        """PDF con resumen calculado en SQL sobre todo el rango y detalle limitado a `max_rows` filas.
 
-        # Crear PDF
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
+        `progress`, si se indica, recibe la fracción completada (0 a 1).
+        """
+        progress = progress or (lambda fraction: None)
+        db_session = Session()
+        try:
+            summary = report_summary_query(db_session, user_id, start_date, end_date).one()
+            by_method = report_summary_query(db_session, user_id, start_date, end_date, group_by='method').all()
+            daily = report_summary_query(db_session, user_id, start_date, end_date, group_by='day').all()
+            progress(0.2)
 
-        # Título
-        pdf.cell(200, 10, txt=f"Reporte de Transacciones ({start_date} a {end_date})", ln=1, align='C')
-        pdf.ln(10)
+            from core.report_pdf import ReportPDF  # fpdf solo en los procesos que generan PDF
+            pdf = ReportPDF()
+            pdf.add_page()
 
-        # Contenido
-        for tx in transactions:
-            pdf.cell(200, 10, txt=f"ID: {tx.id} | Fecha: {tx.date} | Monto: ${tx.amount} | Método: {tx.payment_method}",
-                     ln=1)
+            # Título
+            pdf.set_font("Arial", 'B', 14)
+            pdf.cell(0, 10, txt=f"Reporte de Transacciones ({start_date} a {end_date})", ln=1, align='C')
+            pdf.set_font("Arial", size=9)
+            pdf.cell(0, 6, txt=f"Generado el {datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=1, align='C')
+
+            self._pdf_summary(pdf, summary, by_method)
+            self._pdf_histogram(pdf, daily)
+            progress(0.3)
+            self._pdf_detail(pdf, db_session, user_id, start_date, end_date, summary.count, max_rows)
+            progress(0.9)
+        finally:
+            db_session.close()
 
-        # Guardar archivo
-        filename = f"reporte_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-        filepath = os.path.join(self.reports_dir, filename)
+        # Guardar archivo (nombre único: dos reportes en el mismo segundo no se pisan)
+        if filepath is None:
+            filename = f"reporte_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}.pdf"
+            filepath = os.path.join(self.reports_dir, filename)
         pdf.output(filepath)
+        progress(1.0)
 
         return filepath
 
-    def generate_csv_report(self, user_id, start_date, end_date):
-        # Obtener transacciones
-        transactions = self._get_transactions(user_id, start_date, end_date)
+    def _pdf_summary(self, pdf, summary, by_method):
+        pdf.section("Resumen")
+        flagged_pct = summary.flagged / summary.count * 100 if summary.count else 0.0
+        pdf.table([('Transacciones', 32, 'C'), ('Monto total', 40, 'R'), ('Promedio', 32, 'R'),
+                   ('Mínimo', 28, 'R'), ('Máximo', 28, 'R'), ('Sospechosas', 30, 'C')], [(
+            str(summary.count),
+            _money(summary.total),
+            _money(summary.average or 0),
+            _money(summary.minimum or 0),
+            _money(summary.maximum or 0),
+            f"{summary.flagged} ({flagged_pct:.1f}%)"
+        )])
 
-        # Crear CSV
-        filename = f"reporte_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
-        filepath = os.path.join(self.reports_dir, filename)
+        pdf.section("Por método de pago")
+        pdf.table([('Método', 50, 'L'), ('Cantidad', 30, 'C'), ('Total', 45, 'R'), ('Promedio', 35, 'R'),
+                   ('Sospechosas', 30, 'C')],
+                  [(row.payment_method or '-', str(row.count), _money(row.total), _money(row.average or 0),
+                    str(row.flagged)) for row in by_method])
 
+    def _pdf_histogram(self, pdf, daily, bars=PDF_HISTOGRAM_BARS, height=35):
+        """Histograma de cantidad de transacciones por día (agrupando días si el rango es largo)"""
+        if not daily:
+            return
+        days = [datetime.strptime(str(row.day), '%Y-%m-%d').date() for row in daily]
+        span = (days[-1] - days[0]).days + 1
+        width_days = max(1, math.ceil(span / bars))
+        counts = [0] * math.ceil(span / width_days)
+        for day, row in zip(days, daily):
+            counts[(day - days[0]).days // width_days] += row.count
+
+        label = "por día" if width_days == 1 else f"cada {width_days} días"
+        pdf.section(f"Transacciones {label}")
+        if pdf.get_y() + height + 10 > pdf.h - 15:
+            pdf.add_page()
+
+        left, top, chart_width = pdf.l_margin, pdf.get_y(), pdf.w - pdf.l_margin - pdf.r_margin
+        bar_width = chart_width / len(counts)
+        peak = max(counts) or 1
+        pdf.set_fill_color(70, 110, 170)
+        for i, count in enumerate(counts):
+            bar_height = height * count / peak
+            if bar_height:
+                pdf.rect(left + i * bar_width, top + height - bar_height, max(bar_width - 0.5, 0.2), bar_height, 'F')
+        pdf.line(left, top + height, left + chart_width, top + height)
+
+        pdf.set_y(top + height + 1)
+        pdf.set_font('Arial', size=8)
+        pdf.cell(chart_width / 3, 5, str(days[0]))
+        pdf.cell(chart_width / 3, 5, f"máximo: {peak}", align='C')
+        pdf.cell(chart_width / 3, 5, str(days[-1]), align='R', ln=1)
+
+    def _pdf_detail(self, pdf, db_session, user_id, start_date, end_date, total, max_rows):
+        shown = min(total, max_rows)
+        title = "Detalle" if shown == total else f"Detalle (primeras {shown} de {total} transacciones)"
+        pdf.section(title)
+
+        query = report_transactions_query(
+            db_session, user_id, start_date, end_date,
+            columns=['id', 'date', 'amount', 'payment_method', 'is_flagged']
+        ).limit(max_rows)
+        rows = db_session.execute(query.statement.execution_options(yield_per=REPORT_CHUNK_SIZE))
+        pdf.table([('ID', 20, 'C'), ('Fecha', 45, 'C'), ('Monto', 45, 'R'), ('Método', 45, 'L'),
+                   ('Sospechosa', 25, 'C')],
+                  ((str(tx_id), date.strftime('%Y-%m-%d %H:%M:%S'), _money(amount), method or '-',
+                    'Sí' if flagged else '') for tx_id, date, amount, method, flagged in rows))
+
+    def generate_csv_report(self, user_id, start_date, end_date, filepath=None, progress=None, total=None):
+        """CSV en archivo; con `total` (filas esperadas) se informa el avance a `progress`"""
+        # Crear CSV (nombre único: dos reportes en el mismo segundo no se pisan)
+        if filepath is None:
+            filename = f"reporte_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}.csv"
+            filepath = os.path.join(self.reports_dir, filename)
+
+        written = 0
         with open(filepath, 'w', newline='') as csvfile:
-            fieldnames = ['id', 'date', 'amount', 'payment_method']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for tx in transactions:
-                writer.writerow({
-                    'id': tx.id,
-                    'date': tx.date,
-                    'amount': tx.amount,
-                    'payment_method': tx.payment_method
-                })
+            for chunk in self.iter_csv_report(user_id, start_date, end_date):
+                csvfile.write(chunk)
+                written += chunk.count('\n')
+                if progress and total:
+                    progress(min(written / (total + 1), 1.0))
 
         return filepath
 
-    def _get_transactions(self, user_id, start_date, end_date):
+    def iter_csv_report(self, user_id, start_date, end_date, chunk_size=REPORT_CHUNK_SIZE):
+        """Genera el CSV por bloques leyendo la base con un cursor (memoria constante).
+
+        La sesión se cierra al terminar o cuando el cliente corta la descarga.
+        """
         db_session = Session()
         try:
-            return db_session.query(Transaction).filter(
-                Transaction.user_id == user_id,
-                Transaction.date >= start_date,
-                Transaction.date <= end_date
-            ).order_by(Transaction.date.desc()).all()
+            query = report_transactions_query(db_session, user_id, start_date, end_date, columns=CSV_COLUMNS)
+            result = db_session.execute(query.statement.execution_options(yield_per=chunk_size))
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(CSV_COLUMNS)
+            for rows in result.partitions():
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
         finally:
-            db_session.close()
\ No newline at end of file
+            db_session.close()
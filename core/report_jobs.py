@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+from core.background import RUN_DIR
+from core.database import Session
+from core.queries import report_watermark_query
+from core.report_generator import ReportGenerator
+
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+REPORT_QUEUE_SIZE = int(os.environ.get('REPORT_QUEUE_SIZE', 20))  # trabajos en cola o en curso
+REPORT_CACHE_MAX_MB = int(os.environ.get('REPORT_CACHE_MAX_MB', 500))
+REPORT_CACHE_MAX_AGE_HOURS = float(os.environ.get('REPORT_CACHE_MAX_AGE_HOURS', 24))
+JOB_TTL_SECONDS = 3600  # tiempo que se recuerda un trabajo terminado
+REPORT_JOBS_DIR = os.path.join(RUN_DIR, 'reports')  # estado de los trabajos, visible para todos los workers
+CACHE_FORMAT_VERSION = 1  # cambiarlo invalida los reportes guardados si cambia su contenido
+
+MIMETYPES = {'pdf': 'application/pdf', 'csv': 'text/csv'}
+
+
+class ReportQueueFull(Exception):
+    """Hay demasiados reportes en cola"""
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ReportJobQueue:
+    """Genera reportes en un pool acotado de hilos y guarda el resultado en caché.
+
+    Cada reporte se identifica por un hash de (usuario, rango, formato,
+    huella de los datos): un pedido idéntico sobre datos sin cambios se
+    responde con el archivo ya generado, y si hay uno igual en curso se
+    devuelve ese mismo trabajo. Los archivos viejos de `reports/` se borran
+    por antigüedad y por tamaño total.
+
+    El estado de cada trabajo se guarda además en `jobs_dir/<id>.json`: con
+    varios workers la consulta puede llegar a uno distinto del que lo encoló.
+    """
+
+    def __init__(self, max_workers: int = REPORT_WORKERS, max_pending: int = REPORT_QUEUE_SIZE,
+                 max_bytes: int = REPORT_CACHE_MAX_MB * 2 ** 20,
+                 max_age: float = REPORT_CACHE_MAX_AGE_HOURS * 3600, generator=None,
+                 jobs_dir: str = REPORT_JOBS_DIR):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.generator = generator or ReportGenerator()
+        self.reports_dir = self.generator.reports_dir
+        self.jobs_dir = jobs_dir
+        self._executor = None
+        self._jobs = {}
+        self._active = {}  # clave de caché -> id del trabajo en cola o en curso
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def submit(self, user_id: int, start_date: str, end_date: str, report_format: str) -> dict:
+        """Encola un reporte y devuelve el estado del trabajo (ya terminado si estaba en caché)"""
+        key, rows = self._cache_key(user_id, start_date, end_date, report_format)
+        path = os.path.join(self.reports_dir, f"{key}.{report_format}")
+
+        with self._lock:
+            self._prune_jobs()
+
+            active = self._active.get(key)
+            if active is not None:
+                return dict(self._jobs[active])
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'user_id': user_id,
+                'start_date': start_date,
+                'end_date': end_date,
+                'format': report_format,
+                'key': key,
+                'path': path,
+                'rows': rows,
+                'status': 'queued',
+                'progress': 0.0,
+                'cached': False,
+                'error': None,
+                'created_at': datetime.now().isoformat(),
+                'finished_at': None,
+                'pid': os.getpid(),
+                '_finished': None,
+            }
+
+            if os.path.exists(path):
+                os.utime(path)  # recién usado: el último en desalojarse por tamaño
+                job.update(status='done', progress=1.0, cached=True, finished_at=job['created_at'],
+                           _finished=time.monotonic())
+                self._jobs[job['id']] = job
+                self._save(job)
+                self.cache_hits += 1
+                return dict(job)
+
+            if len(self._active) >= self.max_pending:
+                raise ReportQueueFull(f"Hay {len(self._active)} reportes en proceso, intente más tarde")
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='report')
+            self._jobs[job['id']] = job
+            self._save(job)
+            self._active[key] = job['id']
+            self.cache_misses += 1
+            self._executor.submit(self._run, job['id'])
+            return dict(job)
+
+    def get(self, job_id: str, user_id: int) -> Optional[dict]:
+        """Estado de un trabajo; None si no existe o es de otro usuario"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            job = dict(job) if job is not None else self._load(job_id)
+        if job is None or job['user_id'] != user_id:
+            return None
+        if job['status'] == 'done' and not os.path.exists(job['path']):
+            job['status'] = 'expired'
+        return job
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'active': len(self._active),
+                'jobs': len(self._jobs),
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses
+            }
+
+    def _cache_key(self, user_id, start_date, end_date, report_format) -> tuple:
+        """Devuelve (clave de caché, filas del rango)"""
+        db_session = Session()
+        try:
+            watermark = report_watermark_query(db_session, user_id, start_date, end_date).one()
+        finally:
+            db_session.close()
+        raw = '|'.join(str(part) for part in (CACHE_FORMAT_VERSION, user_id, start_date, end_date,
+                                               report_format, *watermark))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32], watermark[0]
+
+    def _run(self, job_id: str) -> None:
+        job = self._jobs[job_id]
+        self._update(job_id, status='running')
+        tmp_path = f"{job['path']}.{job_id}.tmp"
+
+        def progress(fraction):
+            self._update(job_id, progress=round(min(fraction, 0.99), 2))
+
+        try:
+            if job['format'] == 'pdf':
+                self.generator.generate_pdf_report(job['user_id'], job['start_date'], job['end_date'],
+                                                   filepath=tmp_path, progress=progress)
+            else:
+                self.generator.generate_csv_report(job['user_id'], job['start_date'], job['end_date'],
+                                                   filepath=tmp_path, progress=progress,
+                                                   total=job['rows'])
+            # Publicar el archivo completo de una vez
+            os.replace(tmp_path, job['path'])
+            self._update(job_id, status='done', progress=1.0)
+        except Exception as e:
+            print(f"Error generando reporte {job_id}: {e}")
+            self._update(job_id, status='failed', error=str(e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            with self._lock:
+                self._active.pop(job['key'], None)
+                job['finished_at'] = datetime.now().isoformat()
+                job['_finished'] = time.monotonic()
+                self._save(job)
+            self.evict()
+
+    def _update(self, job_id: str, **values) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            if any(job.get(name) != value for name, value in values.items()):
+                job.update(values)
+                self._save(job)
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job: dict) -> None:
+        """Escribe el estado del trabajo de forma atómica (con el lock tomado)"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        path = self._job_path(job['id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({name: value for name, value in job.items() if not name.startswith('_')}, f)
+        os.replace(tmp_path, path)
+
+    def _load(self, job_id: str) -> Optional[dict]:
+        """Trabajo encolado por otro worker; None si no existe"""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._job_path(job_id)) as f:
+                job = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if job['status'] in ('queued', 'running') and not _alive(job['pid']):
+            job.update(status='failed', error='El proceso que generaba el reporte terminó')
+        return job
+
+    def _prune_jobs(self) -> None:
+        """Olvida los trabajos terminados hace más de JOB_TTL_SECONDS (con el lock tomado)"""
+        limit = time.monotonic() - JOB_TTL_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job['_finished'] is not None and job['_finished'] < limit]:
+            del self._jobs[job_id]
+
+        # Archivos de estado sin cambios en JOB_TTL_SECONDS, de este o de otros workers
+        limit = time.time() - JOB_TTL_SECONDS
+        active = {self._job_path(job_id) for job_id in self._active.values()}
+        try:
+            entries = list(os.scandir(self.jobs_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.path not in active and entry.stat().st_mtime < limit:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def evict(self) -> int:
+        """Borra reportes más viejos que `max_age` y luego los menos usados hasta bajar de `max_bytes`"""
+        now = time.time()
+        with self._lock:
+            in_use = {self._jobs[job_id]['path'] for job_id in self._active.values()}
+
+        files = []
+        for entry in os.scandir(self.reports_dir):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            # Los temporales de trabajos en curso no se tocan salvo que estén abandonados
+            if entry.name.endswith('.tmp') and now - stat.st_mtime < self.max_age:
+                continue
+            if entry.path in in_use:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        removed = 0
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total -= size
+            except OSError:
+                pass
+        return removed
+
+
+report_jobs = ReportJobQueue()
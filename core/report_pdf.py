@@ -0,0 +1,47 @@
+from fpdf import FPDF
+
+
+class ReportPDF(FPDF):
+    """Documento con pie numerado y encabezado de tabla repetido en cada página"""
+
+    def __init__(self):
+        super().__init__()
+        self.table_columns = None  # [(título, ancho, alineación)] de la tabla en curso
+        self.set_auto_page_break(True, margin=15)
+        self.alias_nb_pages()
+
+    def header(self):
+        if self.table_columns:
+            self.table_header()
+
+    def footer(self):
+        self.set_y(-12)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 8, f"Página {self.page_no()}/{{nb}}", align='C')
+
+    def section(self, title):
+        self.ln(4)
+        self.set_font('Arial', 'B', 12)
+        self.cell(0, 8, title, ln=1)
+        self.set_font('Arial', size=9)
+
+    def table_header(self):
+        self.set_font('Arial', 'B', 9)
+        self.set_fill_color(230, 230, 230)
+        for title, width, _ in self.table_columns:
+            self.cell(width, 7, title, border=1, align='C', fill=True)
+        self.ln()
+        self.set_font('Arial', size=9)
+
+    def table_row(self, values):
+        for value, (_, width, align) in zip(values, self.table_columns):
+            self.cell(width, 6, value, border=1, align=align)
+        self.ln()
+
+    def table(self, columns, rows):
+        """Dibuja una tabla; si cruza de página el encabezado se repite"""
+        self.table_columns = columns
+        self.table_header()
+        for values in rows:
+            self.table_row(values)
+        self.table_columns = None
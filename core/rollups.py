@@ -0,0 +1,132 @@
+"""Resumen diario `daily_user_stats` (cantidad, total, mínimo, máximo y sospechosas
+por usuario, día y método de pago).
+
+Se actualiza en la misma transacción que cada inserción y que cada cambio de
+marca de fraude, así los resúmenes del dashboard y de los reportes leen una
+fila por día y método en lugar de todas las transacciones.
+
+Uso: python -m core.rollups rebuild
+"""
+import argparse
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Iterable
+from sqlalchemy import and_, bindparam, case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from core.database import Session
+from core.models import DailyUserStats, Transaction
+
+_STATS = DailyUserStats.__table__
+
+
+def _day(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def record_inserts(db_session, rows: Iterable) -> None:
+    """Suma transacciones nuevas (objetos o dicts con user_id, date, payment_method, amount, is_flagged)"""
+    groups = defaultdict(lambda: {'count': 0, 'total': 0.0, 'min_amount': None, 'max_amount': None, 'flagged': 0})
+    for row in rows:
+        if not isinstance(row, dict):
+            row = {name: getattr(row, name) for name in ('user_id', 'date', 'payment_method', 'amount', 'is_flagged')}
+        amount = float(row['amount'] or 0.0)
+        group = groups[(row['user_id'], _day(row['date']), row['payment_method'] or '')]
+        group['count'] += 1
+        group['total'] += amount
+        group['min_amount'] = amount if group['min_amount'] is None else min(group['min_amount'], amount)
+        group['max_amount'] = amount if group['max_amount'] is None else max(group['max_amount'], amount)
+        group['flagged'] += int(bool(row['is_flagged']))
+    if not groups:
+        return
+
+    connection = db_session.connection()
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(_STATS)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_STATS.c.user_id, _STATS.c.day, _STATS.c.payment_method],
+        set_={
+            'count': _STATS.c.count + stmt.excluded.count,
+            'total': _STATS.c.total + stmt.excluded.total,
+            'min_amount': case((stmt.excluded.min_amount < _STATS.c.min_amount, stmt.excluded.min_amount),
+                               else_=_STATS.c.min_amount),
+            'max_amount': case((stmt.excluded.max_amount > _STATS.c.max_amount, stmt.excluded.max_amount),
+                               else_=_STATS.c.max_amount),
+            'flagged': _STATS.c.flagged + stmt.excluded.flagged,
+        }
+    )
+    connection.execute(stmt, [{'user_id': user_id, 'day': day, 'payment_method': method, **values}
+                              for (user_id, day, method), values in groups.items()])
+
+
+def record_flag_changes(db_session, changes: Iterable) -> None:
+    """Aplica cambios de marca: `changes` son (user_id, date, payment_method, +1 o -1)"""
+    deltas = defaultdict(int)
+    for user_id, tx_date, method, delta in changes:
+        deltas[(user_id, _day(tx_date), method or '')] += delta
+    params = [{'b_user_id': user_id, 'b_day': day, 'b_method': method, 'delta': delta}
+              for (user_id, day, method), delta in deltas.items() if delta]
+    if not params:
+        return
+
+    stmt = update(_STATS).where(and_(
+        _STATS.c.user_id == bindparam('b_user_id'),
+        _STATS.c.day == bindparam('b_day'),
+        _STATS.c.payment_method == bindparam('b_method')
+    )).values(flagged=_STATS.c.flagged + bindparam('delta'))
+    db_session.connection().execute(stmt, params)
+
+
+def rebuild(db_session=None) -> int:
+    """Recalcula todo el resumen desde `transactions` con una sola consulta agregada"""
+    own_session = db_session is None
+    db_session = db_session or Session()
+    try:
+        day = func.date(Transaction.date)
+        method = func.coalesce(Transaction.payment_method, '')
+        source = select(
+            Transaction.user_id, day, method,
+            func.count(Transaction.id), func.sum(Transaction.amount),
+            func.min(Transaction.amount), func.max(Transaction.amount),
+            func.coalesce(func.sum(case((Transaction.is_flagged, 1), else_=0)), 0)
+        ).group_by(Transaction.user_id, day, method)
+
+        connection = db_session.connection()
+        connection.execute(delete(_STATS))
+        connection.execute(insert(_STATS).from_select(
+            ['user_id', 'day', 'payment_method', 'count', 'total', 'min_amount', 'max_amount', 'flagged'], source))
+        rows = connection.execute(select(func.count()).select_from(_STATS)).scalar()
+        db_session.commit()
+        return rows
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        if own_session:
+            db_session.close()
+
+
+def ensure_populated() -> None:
+    """Reconstruye el resumen si está vacío pero ya hay transacciones (primera migración)"""
+    db_session = Session()
+    try:
+        if db_session.query(DailyUserStats.user_id).first() is None \
+                and db_session.query(Transaction.id).first() is not None:
+            rows = rebuild(db_session)
+            print(f"🔧 Resumen diario reconstruido: {rows} filas")
+    finally:
+        db_session.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['rebuild'])
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        rows = rebuild()
+        print(f"✅ Resumen diario reconstruido: {rows} filas")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,365 @@
+"""Servicio de puntuación opcional por socket Unix.
+
+Un proceso maestro vigila el registro de modelos y exporta cada versión como
+arrays `.npy` de `CompiledForest` en MODEL_DIR/compiled. SCORING_WORKERS
+procesos hijos aceptan conexiones en el mismo socket y abren esos arrays con
+mmap: las páginas del modelo se comparten entre todos y ningún hijo carga
+sklearn ni deserializa el bosque. Los workers web que tienen SCORING_SOCKET
+definido le envían sus lotes con un protocolo binario y, si el servicio no
+responde, puntúan en su propio proceso.
+
+Protocolo (little endian), una conexión persistente por hilo del cliente:
+  pedido:    '<4sBI' (b'FDS1', operación, filas) + montos f8[n] + fechas i8[n]
+             (microsegundos) + features de comportamiento f8[n, 14] (NaN = sin dato)
+  respuesta: '<4sBIH' (b'FDS1', estado, filas, largo del texto) + texto
+             (versión del modelo o error) + puntajes f8[n] si el estado es 0
+
+Uso: python -m core.scoring_service serve [--socket RUTA] [--workers N]
+"""
+from __future__ import annotations  # NumPy se importa al puntuar, no con core.app
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+from core.fraud_detection import (MODEL_CHECK_INTERVAL, MODEL_DIR, SCORING_SOCKET, CompiledForest, FraudDetector,
+                                  model_registry)
+from core.models import BEHAVIOR_FEATURES
+
+logger = logging.getLogger('scoring_service')
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'fraud_scoring.sock')
+SCORING_WORKERS = int(os.environ.get('SCORING_WORKERS', 2))
+SCORING_TIMEOUT = float(os.environ.get('SCORING_TIMEOUT', 2.0))  # segundos por pedido
+SCORING_RETRY_SECONDS = 5.0  # tras un fallo el cliente puntúa en proceso durante este tiempo
+EXPORT_DIR = os.path.join(MODEL_DIR, 'compiled')
+SCORE_CHUNK = 4096  # filas por pasada del bosque compilado
+
+MAGIC = b'FDS1'
+REQUEST = struct.Struct('<4sBI')  # magic, operación, filas
+RESPONSE = struct.Struct('<4sBIH')  # magic, estado, filas, largo del texto
+OP_SCORE = 1
+STATUS_OK, STATUS_NO_MODEL, STATUS_ERROR = 0, 1, 2
+ROW_BYTES = 8 * (2 + len(BEHAVIOR_FEATURES))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Conexión cerrada por el otro extremo")
+        received += count
+    return buffer
+
+
+def _response(status: int, text: str, scores: Optional[np.ndarray] = None) -> bytes:
+    encoded = text.encode('utf-8')[:65535]
+    rows = 0 if scores is None else len(scores)
+    body = b'' if scores is None else scores.astype('<f8').tobytes()
+    return RESPONSE.pack(MAGIC, status, rows, len(encoded)) + encoded + body
+
+
+# --------------------------
+# Exportación del modelo (proceso maestro)
+# --------------------------
+
+def export_current(export_dir: str = EXPORT_DIR) -> Optional[str]:
+    """Exporta el modelo vigente del registro si cambió; devuelve su versión"""
+    scoring_model = model_registry.get()
+    if scoring_model is None or scoring_model.compiled is None:
+        return None
+
+    pointer = os.path.join(export_dir, 'current.json')
+    try:
+        with open(pointer) as f:
+            if json.load(f)['version'] == scoring_model.version:
+                return scoring_model.version
+    except (OSError, ValueError, KeyError):
+        pass
+
+    dirname = hashlib.sha256(scoring_model.version.encode('utf-8')).hexdigest()[:16]
+    path = os.path.join(export_dir, dirname)
+    if not os.path.exists(path):
+        tmp_path = tempfile.mkdtemp(prefix='.export-', dir=export_dir)
+        scoring_model.compiled.save(tmp_path)
+        os.replace(tmp_path, path)
+
+    tmp_pointer = f"{pointer}.tmp"
+    with open(tmp_pointer, 'w') as f:
+        json.dump({'version': scoring_model.version, 'dir': dirname, 'features': scoring_model.features}, f)
+    os.replace(tmp_pointer, pointer)
+    logger.info(f"Modelo {scoring_model.version} exportado para el servicio de puntuación")
+
+    # Los hijos que todavía tengan mapeada una versión anterior la conservan hasta soltarla
+    for entry in os.scandir(export_dir):
+        if entry.is_dir() and entry.name != dirname:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return scoring_model.version
+
+
+# --------------------------
+# Procesos puntuadores
+# --------------------------
+
+class MappedModel:
+    """Bosque exportado abierto con mmap; se reabre cuando cambia `current.json`"""
+
+    def __init__(self, export_dir: str = EXPORT_DIR, check_interval: float = 1.0):
+        self.export_dir = export_dir
+        self.check_interval = check_interval
+        self._current = None  # (versión, features, bosque)
+        self._stamp = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[tuple]:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._reload()
+        return self._current
+
+    def _reload(self) -> None:
+        self._checked_at = time.monotonic()
+        pointer = os.path.join(self.export_dir, 'current.json')
+        try:
+            stamp = os.stat(pointer).st_mtime_ns
+            if stamp == self._stamp:
+                return
+            with open(pointer) as f:
+                meta = json.load(f)
+            forest = CompiledForest.load(os.path.join(self.export_dir, meta['dir']), mmap=True)
+            self._current = (meta['version'], meta['features'], forest)
+            self._stamp = stamp
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error abriendo el modelo exportado: {str(e)}")
+
+
+def _score_payload(mapped: MappedModel, rows: int, payload: bytearray) -> bytes:
+    import numpy as np
+    current = mapped.get()
+    if current is None:
+        return _response(STATUS_NO_MODEL, "Sin modelo disponible")
+    version, features, forest = current
+
+    amounts = np.frombuffer(payload, dtype='<f8', count=rows).astype(np.float64)
+    dates = np.frombuffer(payload, dtype='<i8', count=rows, offset=8 * rows).astype('datetime64[us]')
+    matrix = np.frombuffer(payload, dtype='<f8', offset=16 * rows).reshape(rows, len(BEHAVIOR_FEATURES))
+    behavior = {name: matrix[:, i].astype(np.float64) for i, name in enumerate(BEHAVIOR_FEATURES)}
+
+    X = FraudDetector._feature_matrix(amounts, dates, features, behavior)
+    scores = np.concatenate([forest.decision_function(X[start:start + SCORE_CHUNK])
+                             for start in range(0, rows, SCORE_CHUNK)]) if rows else np.empty(0)
+    return _response(STATUS_OK, version, scores)
+
+
+def _serve_connection(conn: socket.socket, mapped: MappedModel) -> None:
+    with conn:
+        while True:
+            try:
+                magic, op, rows = REQUEST.unpack(_recv_exact(conn, REQUEST.size))
+                if magic != MAGIC or op != OP_SCORE:
+                    return
+                payload = _recv_exact(conn, rows * ROW_BYTES)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                response = _score_payload(mapped, rows, payload)
+            except Exception as e:
+                logger.error(f"Error puntuando pedido: {str(e)}")
+                response = _response(STATUS_ERROR, str(e))
+            try:
+                conn.sendall(response)
+            except OSError:
+                return
+
+
+def _worker_main(listener: socket.socket, export_dir: str) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    mapped = MappedModel(export_dir)
+    while True:
+        conn, _ = listener.accept()
+        threading.Thread(target=_serve_connection, args=(conn, mapped), daemon=True).start()
+
+
+class ScoringService:
+    """Proceso maestro: socket, procesos puntuadores y exportación de nuevas versiones"""
+
+    def __init__(self, socket_path: str = SCORING_SOCKET or DEFAULT_SOCKET, workers: int = SCORING_WORKERS,
+                 export_dir: str = EXPORT_DIR):
+        self.socket_path = socket_path
+        self.workers = workers
+        self.export_dir = export_dir
+        self._stop = threading.Event()
+
+    def serve(self) -> None:
+        os.makedirs(self.export_dir, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.listen(128)
+
+        # Los hijos se crean antes de cargar el modelo para no heredar una copia de sklearn
+        context = multiprocessing.get_context('fork')
+        processes = [self._spawn(context, listener) for _ in range(self.workers)]
+        signal.signal(signal.SIGTERM, lambda *args: self._stop.set())
+        signal.signal(signal.SIGINT, lambda *args: self._stop.set())
+        print(f"✅ Servicio de puntuación en {self.socket_path} con {self.workers} procesos")
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    export_current(self.export_dir)
+                except Exception as e:
+                    logger.error(f"Error exportando el modelo: {str(e)}")
+                for i, process in enumerate(processes):
+                    if not process.is_alive():
+                        logger.warning(f"Proceso puntuador {process.pid} terminó; se reinicia")
+                        processes[i] = self._spawn(context, listener)
+                self._stop.wait(MODEL_CHECK_INTERVAL)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join(5)
+            listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _spawn(self, context, listener):
+        process = context.Process(target=_worker_main, args=(listener, self.export_dir), daemon=True)
+        process.start()
+        return process
+
+
+def start_sidecar(socket_path: str = SCORING_SOCKET or DEFAULT_SOCKET, wait: float = 10.0) -> subprocess.Popen:
+    """Lanza el servicio como subproceso y espera a que el socket exista"""
+    process = subprocess.Popen([sys.executable, '-m', 'core.scoring_service', 'serve', '--socket', socket_path])
+    deadline = time.monotonic() + wait
+    while not os.path.exists(socket_path) and time.monotonic() < deadline and process.poll() is None:
+        time.sleep(0.05)
+    return process
+
+
+# --------------------------
+# Cliente (workers web)
+# --------------------------
+
+class ScoringClient:
+    """Envía lotes al servicio por una conexión persistente por hilo.
+
+    `score` devuelve None ante cualquier falla (servicio caído, sin modelo,
+    tiempo agotado) para que el llamador puntúe en su propio proceso; después
+    de un error de conexión no se reintenta durante SCORING_RETRY_SECONDS.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = SCORING_TIMEOUT,
+                 retry_after: float = SCORING_RETRY_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._local = threading.local()
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.fallbacks = 0
+
+    def _connection(self) -> socket.socket:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def _close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def score(self, transactions) -> Optional[tuple]:
+        """(puntajes, versión del modelo) o None si hay que puntuar en proceso"""
+        import numpy as np
+        if time.monotonic() < self._down_until:
+            return self._fallback()
+
+        amounts, dates, behavior = FraudDetector._batch_columns(transactions)
+        rows = len(amounts)
+        if rows == 0:
+            return None
+        matrix = np.column_stack([behavior[name] if name in behavior else np.full(rows, np.nan)
+                                  for name in BEHAVIOR_FEATURES])
+        request = b''.join((REQUEST.pack(MAGIC, OP_SCORE, rows),
+                            amounts.astype('<f8').tobytes(),
+                            dates.astype('datetime64[us]').astype('<i8').tobytes(),
+                            matrix.astype('<f8').tobytes()))
+        try:
+            conn = self._connection()
+            conn.sendall(request)
+            magic, status, count, text_length = RESPONSE.unpack(_recv_exact(conn, RESPONSE.size))
+            text = _recv_exact(conn, text_length).decode('utf-8')
+            if magic != MAGIC:
+                raise ConnectionError("Respuesta inválida del servicio de puntuación")
+            if status != STATUS_OK:
+                if status == STATUS_ERROR:
+                    logger.warning(f"El servicio de puntuación devolvió un error: {text}")
+                return self._fallback()
+            scores = np.frombuffer(_recv_exact(conn, count * 8), dtype='<f8').astype(np.float64)
+        except (OSError, ConnectionError, struct.error) as e:
+            self._close()
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning(f"Servicio de puntuación no disponible ({str(e)}); se puntúa en proceso")
+            return self._fallback()
+
+        with self._lock:
+            self.requests += 1
+        return scores, text
+
+    def _fallback(self) -> None:
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {'socket': self.socket_path, 'requests': self.requests, 'fallbacks': self.fallbacks}
+
+
+scoring_client = ScoringClient(SCORING_SOCKET) if SCORING_SOCKET else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['serve'])
+    parser.add_argument('--socket', default=SCORING_SOCKET or DEFAULT_SOCKET)
+    parser.add_argument('--workers', type=int, default=SCORING_WORKERS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'serve':
+        ScoringService(args.socket, args.workers).serve()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,89 @@
+"""Arranque de producción.
+
+gunicorn (varios procesos con hilos): el maestro importa wsgi.py con
+preload_app, prepara la base y carga el modelo antes del fork, así los workers
+comparten por copy-on-write las páginas del modelo en vez de cargar cada uno
+su copia. Después del fork cada worker arranca sus servicios de fondo y uno
+solo queda como líder del monitor, el recálculo y el entrenamiento
+(core.background). waitress (un proceso con hilos) usa el mismo código sin fork.
+
+Cada dashboard conectado por SSE ocupa un hilo mientras dura la conexión, así
+que el límite de streams sale de los hilos configurados: cada proceso acepta
+sus hilos menos STREAM_RESERVED_THREADS (core.streaming.stream_limit), que
+quedan para la API y las páginas. Con los valores por defecto (32 hilos, 4
+reservados) son 28 dashboards por worker. Un hilo esperando eventos casi no
+consume CPU ni memoria, así que para más dashboards se sube WEB_THREADS. Por
+encima del límite el stream responde 503 y el dashboard consulta cada 5
+segundos: es el camino esperado, no un error.
+
+Uso: python -m core.server [gunicorn|waitress] [--workers N] [--threads N] [--port P]
+"""
+import argparse
+import atexit
+import logging
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN_CONFIG = os.path.join(BASE_DIR, 'gunicorn.conf.py')
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', 5000))
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1))
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 32))  # todos menos STREAM_RESERVED_THREADS pueden atender SSE
+WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 60))
+
+
+def start_scoring_sidecar():
+    """Con SCORING_SOCKET levanta el servicio de puntuación junto al servidor web"""
+    socket_path = os.environ.get('SCORING_SOCKET')
+    if not socket_path:
+        return None
+    from core.scoring_service import start_sidecar
+    process = start_sidecar(socket_path)
+    owner = os.getpid()  # los workers de gunicorn heredan el atexit: solo lo detiene quien lo lanzó
+    atexit.register(lambda: os.getpid() == owner and process.terminate())
+    return process
+
+
+def serve_gunicorn(workers: int, threads: int, port: int) -> int:
+    os.environ.update(WEB_WORKERS=str(workers), WEB_THREADS=str(threads), PORT=str(port))
+    try:
+        os.execvp('gunicorn', ['gunicorn', '-c', GUNICORN_CONFIG, 'wsgi:app'])
+    except FileNotFoundError:
+        print("❌ gunicorn no está instalado (pip install gunicorn)")
+        return 1
+
+
+def serve_waitress(threads: int, port: int) -> int:
+    try:
+        import waitress
+    except ImportError:
+        print("❌ waitress no está instalado (pip install waitress)")
+        return 1
+    from core.app import background, create_app
+    from core.streaming import monitoring_events, stream_limit
+
+    logging.basicConfig(level=logging.INFO)
+    start_scoring_sidecar()
+    app = create_app(warmup=True)
+    monitoring_events.max_clients = stream_limit(threads)
+    background.start()
+    waitress.serve(app, host=HOST, port=port, threads=threads)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('server', nargs='?', choices=['gunicorn', 'waitress'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS, help='procesos (solo gunicorn)')
+    parser.add_argument('--threads', type=int, default=WEB_THREADS, help='hilos por proceso')
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    if args.server == 'gunicorn':
+        return serve_gunicorn(args.workers, args.threads, args.port)
+    return serve_waitress(args.threads, args.port)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+from collections import deque
+from typing import List, Optional
+from core.server import WEB_THREADS
+
+HISTORY_SIZE = 200  # eventos por usuario disponibles para reanudar con Last-Event-ID
+CLIENT_BUFFER_SIZE = 100  # eventos pendientes por cliente antes de descartar los más viejos
+HEARTBEAT_SECONDS = 15
+# Con workers de hilos cada cliente SSE ocupa un hilo mientras está conectado:
+# estos quedan siempre libres para la API y las páginas
+STREAM_RESERVED_THREADS = int(os.environ.get('STREAM_RESERVED_THREADS', 4))
+
+
+def stream_limit(threads: int) -> int:
+    """Clientes SSE por proceso con `threads` hilos: STREAM_MAX_CLIENTS si está
+    definido, si no todos menos STREAM_RESERVED_THREADS"""
+    fixed = os.environ.get('STREAM_MAX_CLIENTS')
+    return int(fixed) if fixed else max(threads - STREAM_RESERVED_THREADS, 1)
+
+
+class StreamLimitReached(Exception):
+    """Este proceso ya atiende el máximo de clientes SSE"""
+
+
+class Subscription:
+    """Buffer acotado de eventos pendientes de un cliente SSE"""
+
+    def __init__(self, user_id: int, buffer_size: int = CLIENT_BUFFER_SIZE):
+        self.user_id = user_id
+        self.dropped = 0
+        self._events = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+
+    def push(self, event: dict) -> None:
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+
+    def wait(self, timeout: float) -> List[dict]:
+        """Devuelve los eventos pendientes o una lista vacía si pasó `timeout` sin novedades"""
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class MonitoringBroadcaster:
+    """Reparte los eventos del monitor entre los dashboards conectados por SSE.
+
+    Cada evento se publica una sola vez y se copia al buffer de los clientes
+    del usuario al que pertenece; además se guarda un historial corto por
+    usuario para que un cliente reconectado reanude desde su Last-Event-ID.
+    """
+
+    def __init__(self, history_size: int = HISTORY_SIZE, buffer_size: int = CLIENT_BUFFER_SIZE,
+                 max_clients: Optional[int] = None):
+        self.history_size = history_size
+        self.buffer_size = buffer_size
+        self.max_clients = max_clients or stream_limit(WEB_THREADS)  # el servidor lo ajusta a sus hilos
+        self.rejected = 0
+        self._last_id = 0
+        self._history = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id: int, event_type: str, data: dict, event_id: Optional[int] = None) -> dict:
+        """Publica un evento; `event_id` conserva la numeración del proceso que lo generó"""
+        with self._lock:
+            self._last_id = self._last_id + 1 if event_id is None else max(self._last_id, event_id)
+            event = {'id': self._last_id if event_id is None else event_id, 'event': event_type, 'data': data}
+            history = self._history.get(user_id)
+            if history is None:
+                history = self._history[user_id] = deque(maxlen=self.history_size)
+            history.append(event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscribers:
+            subscription.push(event)
+        return event
+
+    def publish_transaction(self, tx) -> List[dict]:
+        """Callback del `TransactionMonitor`: publica la transacción y, si es sospechosa, una alerta"""
+        data = {
+            'id': tx.id,
+            'amount': float(tx.amount),
+            'date': tx.date.strftime('%Y-%m-%d %H:%M:%S'),
+            'payment_method': tx.payment_method,
+            'is_fraud': bool(tx.is_flagged),
+            'fraud_score': tx.fraud_score
+        }
+        events = [self.publish(tx.user_id, 'transaction', data)]
+        if tx.is_flagged:
+            events.append(self.publish(tx.user_id, 'alert', data))
+        return events
+
+    def subscribe(self, user_id: int, last_event_id: Optional[int] = None) -> Subscription:
+        """Registra un cliente y le entrega los eventos posteriores a `last_event_id`.
+
+        Lanza StreamLimitReached si ya hay `max_clients` conectados.
+        """
+        subscription = Subscription(user_id, self.buffer_size)
+        with self._lock:
+            if sum(len(subscribers) for subscribers in self._subscribers.values()) >= self.max_clients:
+                self.rejected += 1
+                raise StreamLimitReached(f"Hay {self.max_clients} monitores conectados a este servidor")
+            if last_event_id is not None:
+                for event in self._history.get(user_id, ()):
+                    if event['id'] > last_event_id:
+                        subscription.push(event)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def client_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+def format_sse(event: dict) -> str:
+    """Serializa un evento en el formato text/event-stream"""
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+monitoring_events = MonitoringBroadcaster()
@@ -0,0 +1,40 @@
+"""Configuración de gunicorn: gunicorn -c gunicorn.conf.py wsgi:app
+
+WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT, HOST y PORT se leen del entorno (core.server).
+"""
+import gc
+import os
+from core.server import BASE_DIR, HOST, PORT, WEB_THREADS, WEB_TIMEOUT, WEB_WORKERS, start_scoring_sidecar
+
+# Solo el worker líder recibe eventos propios: lo registrado en los demás le
+# llega al monitor por la pasada de recuperación, que aquí es frecuente
+os.environ.setdefault('MONITOR_CATCH_UP_SECONDS', '2')
+
+bind = f"{HOST}:{PORT}"
+workers = WEB_WORKERS
+threads = WEB_THREADS
+worker_class = 'gthread'
+timeout = WEB_TIMEOUT
+chdir = BASE_DIR
+preload_app = True  # wsgi.py se importa en el maestro: base lista y modelo cargado antes del fork
+
+
+def on_starting(server):
+    start_scoring_sidecar()
+
+
+def when_ready(server):
+    # Lo cargado hasta aquí queda fuera del recolector: los workers no tocan
+    # esas páginas al recorrerlas y siguen compartiéndolas con el maestro
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from core.app import background
+    from core.database import engine
+    from core.streaming import monitoring_events, stream_limit
+    engine.dispose(close=False)  # no reutilizar las conexiones abiertas por el maestro
+    # Límite de SSE según los hilos efectivos (también si se pasó --threads a gunicorn)
+    monitoring_events.max_clients = stream_limit(server.cfg.threads)
+    background.start()
@@ -1,6 +1,19 @@
+import atexit
+import logging
 import os
-from core.app import app
+from core.app import background, create_app
+from core.scoring_service import start_sidecar
 
+# Servidor de desarrollo; en producción usar `python -m core.server` (gunicorn o waitress)
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     port = int(os.environ.get("PORT", 5000))
+    # Con SCORING_SOCKET se levanta el servicio de puntuación una sola vez
+    # (en el proceso vigilante del recargador de Flask, no en cada recarga)
+    if os.environ.get("SCORING_SOCKET") and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        scoring_process = start_sidecar(os.environ["SCORING_SOCKET"])
+        atexit.register(scoring_process.terminate)
+    app = create_app()
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        background.start()  # solo en el proceso que atiende, no en el vigilante
     app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,45 @@
+"""Paridad del bosque compilado con sklearn (core.fraud_detection.CompiledForest)"""
+import numpy as np
+import pytest
+from sklearn.preprocessing import StandardScaler
+from benchmarks.forest import synthetic
+from core.fraud_detection import COMPILED_MAX_BATCH, FEATURES, CompiledForest, FraudDetector, ScoringModel
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    X = synthetic(5000)
+    scaler = StandardScaler().fit(X)
+    model = FraudDetector()._build_model().fit(scaler.transform(X))
+    return model, scaler
+
+
+@pytest.mark.parametrize('seed, factor', [(1, 1.0), (2, 50.0)])  # filas nuevas y valores extremos
+def test_scores_match_sklearn(fitted, seed, factor):
+    model, scaler = fitted
+    compiled = CompiledForest.from_model(model, scaler)
+    X = synthetic(2000, seed=seed) * factor
+
+    X_scaled = scaler.transform(X)
+    np.testing.assert_array_equal(compiled.decision_function(X) + compiled.offset, model.score_samples(X_scaled))
+    np.testing.assert_array_equal(compiled.predict(X), model.predict(X_scaled))
+
+
+def test_random_rows_match_sklearn(fitted):
+    model, scaler = fitted
+    compiled = CompiledForest.from_model(model, scaler)
+    X = np.random.default_rng(3).normal(size=(500, len(FEATURES))) * 1000
+
+    np.testing.assert_array_equal(compiled.decision_function(X), model.decision_function(scaler.transform(X)))
+
+
+def test_scoring_model_uses_compiled_forest_for_small_batches(fitted):
+    model, scaler = fitted
+    scoring_model = ScoringModel(model, scaler, 'test', FEATURES)
+    assert scoring_model.compiled is not None  # pasó la verificación al cargar
+
+    X = synthetic(COMPILED_MAX_BATCH + 1, seed=4)
+    expected = model.decision_function(scaler.transform(X))
+    small = X[:COMPILED_MAX_BATCH]
+    np.testing.assert_array_equal(scoring_model.decision_function(small), expected[:COMPILED_MAX_BATCH])
+    np.testing.assert_array_equal(scoring_model.decision_function(X), expected)
@@ -0,0 +1,105 @@
+"""Carga masiva (core.ingest.BulkIngestor) sobre una base SQLite en memoria"""
+import io
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+from dateutil.tz import tzlocal
+from sqlalchemy.orm import sessionmaker
+from core.database import Base, create_db_engine
+from core.duplicates import duplicate_windows
+from core.ingest import BulkIngestor, iter_csv_records, iter_ndjson_records, parse_dates
+from core.models import Transaction, User
+
+
+class UnscoredDetector:
+    """Sin modelo: las transacciones se insertan sin puntaje, como antes del primer entrenamiento"""
+
+    def score_with_version(self, values):
+        return None, None
+
+
+@pytest.fixture
+def db_session():
+    engine = create_db_engine('sqlite://', pragmas={})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(id=1, username='test', email='test@example.com', password_hash='x', role='user'))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def ingest_csv(db_session, text, **options):
+    ingestor = BulkIngestor(db_session, 1, detector=UnscoredDetector(), **options)
+    return ingestor.ingest(iter_csv_records(io.BytesIO(text.encode())))
+
+
+def stored_dates(db_session):
+    return sorted(date for date, in db_session.query(Transaction.date))
+
+
+def local_naive(value: str) -> datetime:
+    """Hora local sin zona de una fecha ISO 8601 con zona"""
+    return pd.Timestamp(value).tz_convert(tzlocal()).tz_localize(None).to_pydatetime()
+
+
+def test_dates_with_offset_are_stored_as_local_naive_datetimes(db_session):
+    csv_result = ingest_csv(db_session, "amount,method,date\n100,Efectivo,2025-01-01T10:00:00Z\n")
+    ndjson = b'{"amount": "200", "method": "Efectivo", "date": "2025-03-01T10:00:00+00:00"}\n' \
+             b'{"amount": "300", "method": "Efectivo", "date": "2025-03-01T10:00:00-03:00"}\n'
+    ndjson_result = BulkIngestor(db_session, 1, detector=UnscoredDetector()) \
+        .ingest(iter_ndjson_records(io.BytesIO(ndjson)))
+
+    assert csv_result['summary']['inserted'] == 1
+    assert ndjson_result['summary']['inserted'] == 2
+    assert stored_dates(db_session) == sorted([local_naive('2025-01-01T10:00:00Z'),
+                                               local_naive('2025-03-01T10:00:00+00:00'),
+                                               local_naive('2025-03-01T10:00:00-03:00')])
+
+
+def test_parse_dates_mixes_naive_and_offset_values():
+    parsed = parse_dates(pd.Series(['2025-03-01T10:00:00+05:30', '2025-03-01T10:00', '2025-03-01', 'x', None]))
+
+    assert str(parsed.dtype) == 'datetime64[ns]'
+    assert parsed[0] == local_naive('2025-03-01T10:00:00+05:30')
+    assert parsed[1] == pd.Timestamp('2025-03-01 10:00')  # sin zona: se toma tal cual
+    assert parsed[2] == pd.Timestamp('2025-03-01')
+    assert parsed[3:].isna().all()
+
+
+def test_rows_without_date_are_not_duplicates_of_each_other(db_session):
+    result = ingest_csv(db_session, "amount,method,date\n100,Efectivo,\n100,Efectivo,\n")
+    assert result['summary']['inserted'] == 2
+
+
+def test_near_duplicates_follow_the_single_transaction_rule(db_session):
+    result = ingest_csv(db_session, "amount,method,date\n"
+                                    "100.00,Efectivo,2025-01-01 10:00:00\n"
+                                    "100.04,Efectivo,2025-01-01 10:00:30\n"  # ±0.05 dentro de 60 s
+                                    "100.10,Efectivo,2025-01-01 10:00:30\n"  # fuera de la tolerancia
+                                    "100.00,Transferencia,2025-01-01 10:00:30\n"  # otro método
+                                    "100.00,Efectivo,2025-01-01 10:01:10\n")  # a 70 s de la primera
+    # La repetida rechazada no se guarda: no cuenta para las siguientes, como en el formulario
+    statuses = [row['status'] for row in result['rows']]
+    assert statuses == ['inserted', 'duplicate', 'inserted', 'inserted', 'inserted']
+
+
+def test_near_duplicates_of_stored_and_earlier_chunk_rows(db_session):
+    db_session.add(Transaction(user_id=1, amount=50.0, payment_method='Efectivo',
+                               date=datetime(2024, 6, 1, 12, 0, 0), is_flagged=False))
+    db_session.commit()
+    result = ingest_csv(db_session, "amount,method,date\n"
+                                    "50.01,Efectivo,2024-06-01 11:59:20\n"  # 40 s antes de la guardada
+                                    "80,Efectivo,2025-01-01 10:00:00\n"
+                                    "10,Efectivo,2023-01-01 10:00:00\n"
+                                    "80.02,Efectivo,2025-01-01 10:00:45\n",  # repite una del lote anterior
+                        chunk_size=3)
+    assert [row['status'] for row in result['rows']] == ['duplicate', 'inserted', 'inserted', 'duplicate']
+
+
+def test_duplicate_windows_cover_each_date_and_merge_overlaps():
+    base = datetime(2025, 1, 1, 10, 0, 0)
+    windows = duplicate_windows([base, base + timedelta(seconds=90), base + timedelta(days=365)])
+    assert windows == [(base - timedelta(seconds=60), base + timedelta(seconds=150)),
+                       (base + timedelta(days=365, seconds=-60), base + timedelta(days=365, seconds=60))]
@@ -0,0 +1,18 @@
+"""Regresión de planes: las consultas frecuentes deben buscar por índice (benchmarks.query_plans)"""
+from benchmarks.query_plans import audit, uses_full_scan
+
+
+def test_hot_queries_use_bounded_searches():
+    plans = audit()
+    assert plans
+    assert not [name for name, plan in plans.items() if uses_full_scan(plan)]
+
+
+def test_full_index_scan_counts_as_full_scan():
+    assert uses_full_scan(['SCAN transactions'])
+    assert uses_full_scan(['SCAN transactions USING INDEX ix_transactions_user_date'])
+    assert uses_full_scan(['SCAN transactions USING COVERING INDEX ix_transactions_user_date'])
+    assert not uses_full_scan(['SCAN transactions USING COVERING INDEX ix_transactions_user_date'],
+                              allow_covering_scan=True)
+    assert not uses_full_scan(['SEARCH transactions USING INDEX ix_transactions_user_date (user_id=?)',
+                               'USE TEMP B-TREE FOR ORDER BY'])
@@ -0,0 +1,18 @@
+"""Claves de la caché de puntajes (core.fraud_detection.ScoreCache)"""
+from datetime import datetime
+from core.fraud_detection import BEHAVIOR_FEATURES, ScoreCache
+
+
+def transaction(**behavior):
+    return {'id': 7, 'amount': 120.5, 'date': datetime(2025, 3, 1, 10, 30),
+            **{name: 1.0 for name in BEHAVIOR_FEATURES}, **behavior}
+
+
+def test_key_changes_when_features_are_rebuilt():
+    name = BEHAVIOR_FEATURES[0]
+    assert ScoreCache.key('v1', transaction()) != ScoreCache.key('v1', transaction(**{name: 2.0}))
+
+
+def test_key_ignores_id_and_sub_cent_noise():
+    assert ScoreCache.key('v1', transaction()) == ScoreCache.key('v1', {**transaction(), 'id': 8, 'amount': 120.501})
+    assert ScoreCache.key('v1', transaction()) != ScoreCache.key('v2', transaction())
@@ -0,0 +1,37 @@
+"""Regresión de arranque: importar la aplicación no debe cargar las librerías pesadas.
+
+Se revisa core.app (lo que importa cada worker y cada CLI) y no wsgi.py: este
+precarga a propósito el modelo y sus librerías en el maestro de gunicorn para
+compartirlas con los workers (core.app.warm_up).
+"""
+import os
+import subprocess
+import sys
+from benchmarks.importtime import HEAVY_PACKAGES, run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = set(HEAVY_PACKAGES) | {'reportlab'}
+
+
+def imported_packages(code: str, workdir) -> set:
+    """Paquetes de primer nivel que aparecen en la salida de `python -X importtime -c code`"""
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{workdir / 'test.db'}",
+               MODEL_DIR=str(workdir / 'ml'),
+               RUN_DIR=str(workdir / 'run'),
+               PYTHONDONTWRITEBYTECODE='1')
+    env.pop('SCORING_SOCKET', None)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return {line.split('|')[-1].strip().split('.')[0]
+            for line in result.stderr.splitlines() if line.startswith('import time:')}
+
+
+def test_import_app_skips_heavy_packages(tmp_path):
+    packages = imported_packages('import core.app', tmp_path)
+    assert 'core' in packages
+    assert not packages & HEAVY
+
+
+def test_login_page_skips_heavy_packages():
+    assert run(1)['heavy_modules_loaded'] == []
@@ -1,17 +1,114 @@
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
 import json
-from typing import Dict
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 import logging
 
+ALERT_QUEUE_SIZE = int(os.environ.get('ALERT_QUEUE_SIZE', 1000))
+ALERT_DIGEST_SECONDS = float(os.environ.get('ALERT_DIGEST_SECONDS', 30))  # ventana para agrupar alertas
+ALERT_DIGEST_MAX = int(os.environ.get('ALERT_DIGEST_MAX', 200))  # alertas por correo como máximo
+ALERT_MAX_RETRIES = int(os.environ.get('ALERT_MAX_RETRIES', 3))
+ALERT_RETRY_BACKOFF = float(os.environ.get('ALERT_RETRY_BACKOFF', 2.0))  # segundos, se duplica en cada intento
+SMTP_TIMEOUT = 30
+SMTP_MAX_IDLE_SECONDS = 300  # conexiones sin uso por más tiempo se cierran
+SMTP_NOOP_AFTER_SECONDS = 10  # se verifica con NOOP una conexión que estuvo ociosa más que esto
+
+
+class SMTPConnectionPool:
+    """Conexiones SMTP ya autenticadas que se reutilizan entre envíos.
+
+    STARTTLS y login se hacen una vez por conexión y no por correo. Una
+    conexión que falla durante el envío se descarta en lugar de devolverse.
+    """
+
+    def __init__(self, config: Dict, max_size: int = 2, max_idle: float = SMTP_MAX_IDLE_SECONDS):
+        self.config = config
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port'], timeout=SMTP_TIMEOUT)
+        try:
+            if self.config.get('use_tls', True):
+                server.starttls()
+            if self.config.get('username'):
+                server.login(self.config['username'], self.config['password'])
+        except Exception:
+            self._close(server)
+            raise
+        with self._lock:
+            self.opened += 1
+        return server
+
+    def _take(self) -> smtplib.SMTP:
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            idle = now - last_used
+            if idle > self.max_idle:
+                self._close(server)
+                continue
+            if idle > SMTP_NOOP_AFTER_SECONDS:
+                try:
+                    server.noop()
+                except (smtplib.SMTPException, OSError):
+                    self._close(server)
+                    continue
+            return server
+        return self._connect()
+
+    def _give_back(self, server: smtplib.SMTP) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((server, time.monotonic()))
+                return
+        self._close(server)
+
+    @staticmethod
+    def _close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        """Presta una conexión; se devuelve al pool solo si el bloque termina sin error"""
+        server = self._take()
+        try:
+            yield server
+        except Exception:
+            self._close(server)
+            raise
+        self._give_back(server)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
 
 class AlertSystem:
     def __init__(self, config_path: str = 'config/email_config.json'):
         self.logger = logging.getLogger('alert_system')
         self.config = self._load_config(config_path)
         self.setup_complete = bool(self.config)
+        self.pool = SMTPConnectionPool(self.config)
 
     def _load_config(self, path: str) -> Dict:
         """Carga configuración desde archivo JSON"""
@@ -23,29 +120,17 @@ class AlertSystem:
             return {}
 
     def send_alert(self, transaction_data: Dict, fraud_details: Dict) -> bool:
-        """Envía alerta por email y registra en sistema"""
+        """Envía alerta por email y registra en sistema (sincrónico; el monitor usa AlertDispatcher)"""
         if not self.setup_complete:
             self.logger.warning("Alert system not configured")
             return False
 
         try:
-            # Crear mensaje
-            msg = MIMEMultipart()
-            msg['From'] = self.config['sender_email']
-            msg['Subject'] = self._generate_subject(transaction_data)
-
-            # Cuerpo del email
-            body = self._generate_email_body(transaction_data, fraud_details)
-            msg.attach(MIMEText(body, 'html'))
-
-            # Enviar a todos los destinatarios
-            with smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port']) as server:
-                server.starttls()
-                server.login(self.config['username'], self.config['password'])
-
-                for recipient in self.config['recipients']:
-                    msg['To'] = recipient
-                    server.send_message(msg)
+            # Enviar a todos los destinatarios por una misma conexión
+            alerts = [(transaction_data, fraud_details)]
+            with self.pool.connection() as server:
+                for recipient in self.recipients_for(transaction_data):
+                    server.send_message(self.build_message(recipient, alerts), to_addrs=[recipient])
                     self.logger.info(f"Alert sent to {recipient}")
 
             # Registrar en sistema
@@ -56,6 +141,25 @@ class AlertSystem:
             self.logger.error(f"Failed to send alert: {str(e)}")
             return False
 
+    def recipients_for(self, tx: Dict) -> List[str]:
+        """Destinatarios generales más los del usuario de la transacción (`user_recipients`)"""
+        user_recipients = self.config.get('user_recipients', {}).get(str(tx.get('user_id')), [])
+        return list(dict.fromkeys([*self.config.get('recipients', []), *user_recipients]))
+
+    def build_message(self, recipient: str, alerts: List[Tuple[Dict, Dict]]) -> MIMEMultipart:
+        """Un correo con una o varias alertas (resumen)"""
+        msg = MIMEMultipart()
+        msg['From'] = self.config['sender_email']
+        msg['To'] = recipient
+        if len(alerts) == 1:
+            msg['Subject'] = self._generate_subject(alerts[0][0])
+            body = self._generate_email_body(*alerts[0])
+        else:
+            msg['Subject'] = f"ALERTA FRAUDE: {len(alerts)} transacciones sospechosas"
+            body = self._generate_digest_body(alerts)
+        msg.attach(MIMEText(body, 'html'))
+        return msg
+
     def _generate_subject(self, tx: Dict) -> str:
         """Genera asunto del email"""
         return f"ALERTA FRAUDE: Transacción #{tx.get('id')} - ${tx.get('amount', 0):.2f}"
@@ -66,6 +170,28 @@ class AlertSystem:
         <html>
             <body>
                 <h2>Alerta de Transacción Fraudulenta</h2>
+                {self._alert_section(tx, fraud_details)}
+                <p><a href="{self.config.get('dashboard_url', '#')}">Ver en Dashboard</a></p>
+            </body>
+        </html>
+        """
+
+    def _generate_digest_body(self, alerts: List[Tuple[Dict, Dict]]) -> str:
+        """Cuerpo HTML de un resumen con varias alertas"""
+        sections = '<hr>'.join(self._alert_section(tx, details) for tx, details in alerts)
+        return f"""
+        <html>
+            <body>
+                <h2>{len(alerts)} transacciones sospechosas</h2>
+                {sections}
+                <p><a href="{self.config.get('dashboard_url', '#')}">Ver en Dashboard</a></p>
+            </body>
+        </html>
+        """
+
+    @staticmethod
+    def _alert_section(tx: Dict, fraud_details: Dict) -> str:
+        return f"""
                 <p><strong>ID:</strong> {tx.get('id')}</p>
                 <p><strong>Usuario:</strong> {tx.get('user_id')}</p>
                 <p><strong>Monto:</strong> ${tx.get('amount', 0):.2f}</p>
@@ -76,10 +202,6 @@ class AlertSystem:
                 <ul>
                     {''.join(f"<li>{reason}</li>" for reason in fraud_details.get('reasons', []))}
                 </ul>
-
-                <p><a href="{self.config.get('dashboard_url', '#')}">Ver en Dashboard</a></p>
-            </body>
-        </html>
         """
 
     def _log_alert(self, tx: Dict, details: Dict) -> None:
@@ -95,5 +217,165 @@ class AlertSystem:
 
         # Guardar en archivo log
         with open('fraud_alerts.log', 'a') as f:
-            f.write(json.dumps(log_entry) + '\n')
+            f.write(json.dumps(log_entry, default=str) + '\n')
+
+
+_STOP = object()
+
+
+class AlertDispatcher:
+    """Envía alertas en segundo plano agrupadas en resúmenes por destinatario.
+
+    `submit` solo encola (sin bloquear; si la cola está llena la alerta se
+    descarta y se cuenta). Un hilo trabajador junta las alertas que llegan
+    durante `digest_seconds`, arma un correo por destinatario y lo envía por
+    una conexión del pool, reintentando con espera exponencial los errores
+    transitorios.
+    """
+
+    def __init__(self, alert_system: Optional[AlertSystem] = None, digest_seconds: float = ALERT_DIGEST_SECONDS,
+                 maxsize: int = ALERT_QUEUE_SIZE, max_retries: int = ALERT_MAX_RETRIES,
+                 retry_backoff: float = ALERT_RETRY_BACKOFF):
+        self.alert_system = alert_system  # se crea al arrancar el hilo si no se indica
+        self.digest_seconds = digest_seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger('alert_system')
+        self.submitted = 0
+        self.dropped = 0
+        self.sent_messages = 0
+        self.sent_alerts = 0
+        self.failed_alerts = 0
+        self.retries = 0
+
+    def submit(self, transaction_data: Dict, fraud_details: Optional[Dict] = None) -> bool:
+        """Encola una alerta; devuelve False si se descartó"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((transaction_data, fraud_details or {}))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Envía lo pendiente y detiene el hilo trabajador"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if self.alert_system is not None:
+            self.alert_system.pool.close_all()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'sent_messages': self.sent_messages,
+                'sent_alerts': self.sent_alerts,
+                'failed_alerts': self.failed_alerts,
+                'retries': self.retries,
+                'smtp_connections': self.alert_system.pool.opened if self.alert_system else 0
+            }
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.alert_system is None:
+                self.alert_system = AlertSystem()
+            self._thread = threading.Thread(target=self._loop, name='alert-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(pending)
+                return
+            if item is not None:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.digest_seconds
+
+            if pending and (time.monotonic() >= deadline or len(pending) >= ALERT_DIGEST_MAX):
+                self._flush(pending)
+                pending, deadline = [], None
+
+    def _flush(self, alerts: List[Tuple[Dict, Dict]]) -> None:
+        """Un correo por destinatario con todas sus alertas de la ventana"""
+        if not alerts:
+            return
+        system = self.alert_system
+        if not system.setup_complete:
+            self.logger.warning("Alert system not configured")
+            with self._lock:
+                self.failed_alerts += len(alerts)
+            return
+
+        by_recipient = defaultdict(list)
+        for tx, details in alerts:
+            for recipient in system.recipients_for(tx):
+                by_recipient[recipient].append((tx, details))
+
+        for recipient, recipient_alerts in by_recipient.items():
+            try:
+                message = system.build_message(recipient, recipient_alerts)
+            except Exception as e:
+                self.logger.error(f"Failed to build alert digest: {str(e)}")
+                with self._lock:
+                    self.failed_alerts += len(recipient_alerts)
+                continue
+            self._send(message, recipient, len(recipient_alerts))
+
+        for tx, details in alerts:
+            try:
+                system._log_alert(tx, details)
+            except Exception as e:
+                self.logger.error(f"Failed to log alert: {str(e)}")
+
+    def _send(self, message: MIMEMultipart, recipient: str, count: int) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.alert_system.pool.connection() as server:
+                    server.send_message(message, to_addrs=[recipient])
+                with self._lock:
+                    self.sent_messages += 1
+                    self.sent_alerts += count
+                self.logger.info(f"Alert digest ({count}) sent to {recipient}")
+                return True
+            except Exception as e:
+                # Solo se reintentan errores de red y respuestas SMTP transitorias (4xx)
+                permanent = not isinstance(e, (smtplib.SMTPException, OSError)) or \
+                    isinstance(e, smtplib.SMTPRecipientsRefused) or \
+                    (isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500)
+                if permanent or attempt == self.max_retries:
+                    self.logger.error(f"Failed to send alert digest to {recipient}: {str(e)}")
+                    with self._lock:
+                        self.failed_alerts += count
+                    return False
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.retry_backoff * 2 ** attempt)
+        return False
+
 
+alert_dispatcher = AlertDispatcher()
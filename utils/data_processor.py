@@ -1,27 +1,9 @@
 import pandas as pd
-from core.database import Session
-from core.models import Transaction
+from core.loader import load_transactions_frame
 
 
-def prepare_transaction_data():
+def prepare_transaction_data() -> pd.DataFrame:
     """Prepara datos para el modelo de ML"""
-    session = Session()
-    try:
-        # Obtener todas las transacciones
-        transactions = session.query(Transaction).all()
-
-        # Convertir a DataFrame
-        data = []
-        for t in transactions:
-            data.append({
-                'id': t.id,
-                'user_id': t.user_id,
-                'amount': t.amount,
-                'date': t.date,
-                'payment_method': t.payment_method,
-                'is_fraud': t.is_flagged
-            })
-
-        return pd.DataFrame(data)
-    finally:
-        session.close()
\ No newline at end of file
+    # Solo las columnas necesarias, leídas por bloques con tipos compactos
+    df = load_transactions_frame(columns=('id', 'user_id', 'amount', 'date', 'payment_method', 'is_flagged'))
+    return df.rename(columns={'is_flagged': 'is_fraud'})
@@ -0,0 +1,10 @@
+"""Aplicación WSGI de producción.
+
+gunicorn -c gunicorn.conf.py wsgi:app   (o python -m core.server)
+waitress-serve --port 5000 wsgi:app    (o python -m core.server waitress)
+"""
+import logging
+from core.app import create_app
+
+logging.basicConfig(level=logging.INFO)
+app = create_app(warmup=True)